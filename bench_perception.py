@@ -0,0 +1,732 @@
+import cv2
+import numpy as np
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from fit_cats_env import (find_candidate_circles, filter_nested_circles, circle_intersection_area, get_dominant_color, get_candidate_patch,
+                          load_templates, compile_templates, classify_colors, make_cat_mask, classify_candidates,
+                          build_color_lut, load_color_lut, color_label_map, make_detector, DETECTORS,
+                          get_board_census, scale_board, find_template, RestartDetector, CatTracker, MAX_CAT_TYPES, GAME_OVER_THRESHOLD,
+                          DOMINANT_COLOR_METHODS, HOUGH_BANDS, IMG_SIZE)
+from capture import shot_frame, make_capture, merge_rects, roi_rect, roi_slice, MssCapture, ThreadedCapture, CAPTURE_BACKENDS
+from mss.screenshot import ScreenShot
+
+# Offline perception benchmarks. Everything here runs headless (no X server needed) on saved
+# frames such as the screenshots under highscores/, or on synthetic boards when none are available.
+
+# --- Synthetic Boards ---
+SYNTH_COLORS = [(40, 80, 200), (60, 200, 60), (200, 60, 60), (30, 200, 220), (200, 200, 40),
+                (150, 40, 150), (90, 90, 90), (220, 140, 60), (20, 120, 240), (180, 180, 180)]
+SYNTH_RADII = [16, 22, 28, 34, 42, 52, 64, 80, 110, 150]
+SYNTH_BACKGROUND = (235, 235, 235)
+
+def synthetic_background(rng, h=700, w=560):
+    img = np.full((h, w, 3), SYNTH_BACKGROUND, np.uint8)
+    img += rng.integers(0, 6, (h, w, 3)).astype(np.uint8)
+    return img
+
+def draw_synthetic_cat(img, cx, cy, r, cat_id):
+    cv2.circle(img, (cx, cy), r, SYNTH_COLORS[cat_id], -1)
+    cv2.circle(img, (cx, cy), r, (20, 20, 20), 2)
+    cv2.circle(img, (cx - r // 3, cy - r // 4), max(2, r // 8), (10, 10, 10), -1)
+
+def synthetic_board(rng, n_cats=20, h=700, w=560):
+    """Draws non-overlapping outlined, eyed circles on a noisy light background. Returns (img, mask, cats)."""
+    img = synthetic_background(rng, h, w)
+    cats = []
+    for _ in range(n_cats * 20):
+        if len(cats) == n_cats: break
+        cat_id = int(rng.integers(0, len(SYNTH_COLORS)))
+        r = SYNTH_RADII[cat_id]
+        cx, cy = int(rng.integers(r, w - r)), int(rng.integers(r, h - r))
+        # Cats in a real pile touch but do not overlap
+        if any(np.hypot(cx - x, cy - y) < r + other_r for x, y, other_r, _ in cats): continue
+        draw_synthetic_cat(img, cx, cy, r, cat_id)
+        cats.append((cx, cy, r, cat_id))
+    mask = np.full((h, w), 255, np.uint8)
+    return img, mask, cats
+
+def synthetic_templates(rng, per_class=30, jitter=25):
+    """A template library matching synthetic_board(), in load_templates() format."""
+    known_colors, radius_ranges = {}, {}
+    for cat_id, (color, radius) in enumerate(zip(SYNTH_COLORS, SYNTH_RADII)):
+        known_colors[cat_id] = []
+        for _ in range(per_class):
+            c = np.clip(np.array(color) + rng.integers(-jitter, jitter, 3), 0, 255).astype(np.uint8)
+            known_colors[cat_id].append({'color': c, 'radius': radius + int(rng.integers(-2, 3))})
+        radii = [t['radius'] for t in known_colors[cat_id]]
+        radius_ranges[cat_id] = (min(radii) - 3, max(radii) + 3)
+    not_cat_colors = [np.array(SYNTH_BACKGROUND, np.uint8), np.array((10, 10, 10), np.uint8)]
+    return known_colors, not_cat_colors, radius_ranges
+
+# --- Corpus Loading ---
+def load_calibration():
+    if not os.path.exists("calibration_data.json"): return None
+    with open("calibration_data.json", "r") as f: return json.load(f)
+
+def load_frames(frame_dir, calib, limit=None):
+    """Loads saved full-game screenshots and crops them to the agent view. Returns [(path, board_img)]."""
+    roi = calib["agent_view_roi"]
+    frames = []
+    for root, _, files in os.walk(frame_dir):
+        for name in sorted(files):
+            if not name.endswith(".png"): continue
+            img = cv2.imread(os.path.join(root, name))
+            if img is None or img.shape[0] != calib["game_height"] or img.shape[1] != calib["game_width"]: continue
+            frames.append((os.path.join(root, name), img[roi['y']:roi['y']+roi['h'], roi['x']:roi['x']+roi['w']]))
+            if limit and len(frames) >= limit: return frames
+    return frames
+
+def get_boards(args, rng):
+    """Saved boards from --frames when available, otherwise synthetic ones. Returns [(name, board_img, mask)]."""
+    calib = load_calibration()
+    if args.frames and calib is not None and os.path.exists(args.frames):
+        mask = make_cat_mask(calib)
+        boards = [(path, img, mask) for path, img in load_frames(args.frames, calib, args.limit)]
+        if boards: return boards
+        print(f"No usable frames in {args.frames}, falling back to synthetic boards.")
+    boards = []
+    for i in range(args.limit or 20):
+        img, mask, _ = synthetic_board(rng, n_cats=int(rng.integers(5, 40)))
+        boards.append((f"synthetic_{i}", img, mask))
+    return boards
+
+def get_library(args, rng):
+    if os.path.exists(args.templates):
+        library = load_templates(args.templates)
+        if library[0]: return library
+    return synthetic_templates(rng)
+
+def summarize_ms(samples):
+    samples = np.asarray(samples) * 1000.0
+    if len(samples) == 0: return "n/a"
+    return f"mean {samples.mean():7.3f} | p50 {np.percentile(samples, 50):7.3f} | p95 {np.percentile(samples, 95):7.3f} ms"
+
+# --- Dominant Color ---
+def collect_patches(args, boards):
+    """Template exemplars plus the core patch of every Hough candidate on the boards. Returns [(patch, radius)]."""
+    patches = []
+    if os.path.exists(args.templates):
+        for root, _, files in os.walk(args.templates):
+            for name in files:
+                if not name.endswith(".png"): continue
+                img = cv2.imread(os.path.join(root, name))
+                radius_match = re.search(r'_r(\d+)_', name)
+                if img is not None: patches.append((img, int(radius_match.group(1)) if radius_match else 30))
+    for _, board_img, mask in boards:
+        for (cx, cy, r) in find_candidate_circles(board_img, mask):
+            cx, cy, r = int(cx), int(cy), int(r)
+            if r < 15: continue
+            patch = get_candidate_patch(board_img, cx, cy, r)
+            if patch.shape[0] >= 5 and patch.shape[1] >= 5: patches.append((patch, r))
+    return patches
+
+def bench_dominant_color(args):
+    rng = np.random.default_rng(args.seed)
+    boards = get_boards(args, rng)
+    patches = collect_patches(args, boards)
+    template_index = compile_templates(*get_library(args, rng))
+    radii = np.array([r for _, r in patches], dtype=np.float32)
+    has_color = np.ones(len(patches), dtype=bool)
+    print(f"--- Dominant color: {len(patches)} patches, agreement tolerance {args.tol} ---")
+
+    def run(method):
+        colors, times = [], []
+        for patch, _ in patches:
+            t0 = time.perf_counter()
+            colors.append(get_dominant_color(patch, method=method))
+            times.append(time.perf_counter() - t0)
+        return np.array(colors, dtype=np.float32).reshape(-1, 3), times
+
+    reference, _ = run("kmeans")
+    reference_ids = classify_colors(reference, radii, has_color, template_index)
+    # k-means uses random centers, so a second k-means run gives the noise floor for agreement
+    for method in ["kmeans"] + [m for m in DOMINANT_COLOR_METHODS if m != "kmeans"]:
+        colors, times = run(method)
+        dist = np.linalg.norm(colors - reference, axis=1)
+        ids = classify_colors(colors, radii, has_color, template_index)
+        print(f"{method:<12} | {summarize_ms(times)} | color agree {np.mean(dist <= args.tol):6.1%} "
+              f"(mean dist {dist.mean():5.1f}) | class agree {np.mean(ids == reference_ids):6.1%}")
+
+# --- Hough ---
+def match_circles(reference, circles, tol=3):
+    """Fraction of reference circles with a circle within tol px in center and radius."""
+    reference = np.asarray(reference, dtype=np.float32).reshape(-1, 3)
+    circles = np.asarray(circles, dtype=np.float32).reshape(-1, 3)
+    if len(reference) == 0: return 1.0
+    if len(circles) == 0: return 0.0
+    center_dist = np.hypot(reference[:, None, 0] - circles[None, :, 0], reference[:, None, 1] - circles[None, :, 1])
+    radius_dist = np.abs(reference[:, None, 2] - circles[None, :, 2])
+    return float(np.mean(((center_dist <= tol) & (radius_dist <= tol)).any(axis=1)))
+
+def legacy_hough(img, mask):
+    """The four separate HoughCircles passes find_candidate_circles() replaced, each over its own blur."""
+    all_circles = []
+    for min_dist, param2, min_radius, max_radius in HOUGH_BANDS:
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        blurred = cv2.GaussianBlur(cv2.bitwise_and(gray, mask) if mask is not None else gray, (5, 5), 1.5)
+        circles = cv2.HoughCircles(blurred, cv2.HOUGH_GRADIENT, dp=1, minDist=min_dist,
+                                   param1=50, param2=param2, minRadius=min_radius, maxRadius=max_radius)
+        if circles is not None: all_circles.extend(circles[0, :])
+    return np.uint16(np.around(all_circles)) if all_circles else []
+
+def bench_hough(args):
+    rng = np.random.default_rng(args.seed)
+    boards = get_boards(args, rng)
+    print(f"--- Hough: {len(boards)} boards, separate passes vs HOUGH_BANDS on one shared blur ---")
+    pool = ThreadPoolExecutor(max_workers=len(HOUGH_BANDS))
+    variants = {"legacy": legacy_hough, "shared": find_candidate_circles,
+                "threaded": lambda img, mask: find_candidate_circles(img, mask, executor=pool)}
+    results = {}
+    for name, fn in variants.items():
+        times, results[name] = [], []
+        for _, board_img, mask in boards:
+            t0 = time.perf_counter()
+            results[name].append(np.asarray(fn(board_img, mask)).reshape(-1, 3))
+            times.append(time.perf_counter() - t0)
+        print(f"{name:<9} | {summarize_ms(times)} | {sum(len(c) for c in results[name])} candidates")
+    pool.shutdown()
+    mismatches = {name: sum(not np.array_equal(a, b) for a, b in zip(results["legacy"], results[name])) for name in ("shared", "threaded")}
+    print(f"boards whose candidates differ from the separate passes: shared {mismatches['shared']}, threaded {mismatches['threaded']} / {len(boards)}")
+    if any(mismatches.values()):
+        print("FAIL: HOUGH_BANDS candidates differ from the separate passes")
+        sys.exit(1)
+
+# --- Classifier ---
+def bench_classifier(args):
+    rng = np.random.default_rng(args.seed)
+    boards = get_boards(args, rng)
+    library = get_library(args, rng)
+    known_colors, not_cat_colors, radius_ranges = library
+
+    t0 = time.perf_counter()
+    lut = build_color_lut(known_colors, not_cat_colors)
+    build_s = time.perf_counter() - t0
+    if os.path.exists(args.templates):
+        t0 = time.perf_counter()
+        lut = load_color_lut(args.templates, known_colors, not_cat_colors)
+        print(f"LUT from cache dir: {(time.perf_counter() - t0) * 1000:.1f} ms")
+    print(f"--- Classifier: {len(boards)} boards, LUT {lut.shape} built in {build_s:.2f} s ---")
+
+    indexes = {"colors": compile_templates(*library), "lut": compile_templates(*library, lut=lut)}
+    candidates = [find_candidate_circles(board_img, mask) for _, board_img, mask in boards]
+    results = {}
+    for name, template_index in indexes.items():
+        times, labels = [], []
+        for (_, board_img, _), raw_circles in zip(boards, candidates):
+            t0 = time.perf_counter()
+            _, not_cat, class_ids = classify_candidates(board_img, raw_circles, template_index)
+            times.append(time.perf_counter() - t0)
+            labels.append(np.where(not_cat, -2, class_ids))
+        results[name] = np.concatenate(labels) if labels else np.zeros(0)
+        print(f"{name:<7} | {summarize_ms(times)} per board")
+
+    label_times = []
+    for _, board_img, _ in boards:
+        t0 = time.perf_counter()
+        color_label_map(board_img, lut)
+        label_times.append(time.perf_counter() - t0)
+    print(f"label map | {summarize_ms(label_times)} per board")
+    agree = np.mean(results["colors"] == results["lut"]) if len(results["colors"]) else float("nan")
+    print(f"{len(results['colors'])} candidates | lut agrees with colors on {agree:.1%} (class or not-a-cat)")
+
+# --- Detectors ---
+def bench_detector(args):
+    """Candidate recall and latency of every detector backend, against ground truth on synthetic boards or Hough on recorded ones."""
+    rng = np.random.default_rng(args.seed)
+    boards = get_boards(args, rng)
+    background = cv2.imread("template_empty_board.png") if os.path.exists("template_empty_board.png") else None
+    if boards[0][0].startswith("synthetic") or background is None:
+        # A fresh noise sample, since a real empty-board capture never matches a later frame pixel for pixel
+        background = synthetic_background(rng)
+        boards, references = [], []
+        for i in range(args.limit or 20):
+            img, mask, cats = synthetic_board(rng, n_cats=int(rng.integers(5, 40)))
+            boards.append((f"synthetic_{i}", img, mask))
+            references.append([c[:3] for c in cats])
+        print(f"--- Detectors: {len(boards)} synthetic boards, recall of drawn cats within {args.tol} px ---")
+    else:
+        references = []
+        for _, board_img, mask in boards:
+            circles = find_candidate_circles(board_img, mask)
+            references.append(filter_nested_circles(circles) if len(circles) > 0 else [])
+        print(f"--- Detectors: {len(boards)} recorded boards, recall of the final Hough circles within {args.tol} px ---")
+
+    for name in DETECTORS:
+        detector = make_detector(name, background)
+        times, recalls, counts = [], [], 0
+        for (_, board_img, mask), reference in zip(boards, references):
+            t0 = time.perf_counter()
+            circles = detector(board_img, mask)
+            times.append(time.perf_counter() - t0)
+            counts += len(circles)
+            recalls.append(match_circles(reference, circles, args.tol))
+        print(f"{name:<10} | {summarize_ms(times)} | recall {np.mean(recalls):6.1%} | {counts} candidates")
+
+# --- Perception Scale ---
+def bench_scale(args):
+    """Census accuracy and latency of the board census at each perception scale."""
+    rng = np.random.default_rng(args.seed)
+    template_index = compile_templates(*get_library(args, rng))
+    boards = get_boards(args, rng)
+    truths = None
+    if boards[0][0].startswith("synthetic"):
+        boards, truths = [], []
+        for i in range(args.limit or 20):
+            img, mask, cats = synthetic_board(rng, n_cats=int(rng.integers(5, 40)))
+            boards.append((f"synthetic_{i}", img, mask))
+            truths.append(np.bincount([c[3] for c in cats], minlength=MAX_CAT_TYPES).astype(np.float32))
+    background = cv2.imread("template_empty_board.png") if os.path.exists("template_empty_board.png") else synthetic_background(rng)
+    print(f"--- Perception scale: {len(boards)} boards, {args.detector} detector, census vs {'drawn cats' if truths else 'scale 1.0'} ---")
+
+    reference = None
+    for scale in sorted(set([1.0] + args.scales), reverse=True):
+        detector = make_detector(args.detector, background, scale=scale)
+        times, results = [], []
+        for _, board_img, mask in boards:
+            t0 = time.perf_counter()
+            census, pile_height = get_board_census(scale_board(board_img, scale), scale_board(mask, scale, cv2.INTER_NEAREST),
+                                                   template_index, detector, scale)
+            times.append(time.perf_counter() - t0)
+            results.append((census, pile_height))
+        if reference is None: reference = results
+        expected = truths or [census for census, _ in reference]
+        exact = np.mean([np.array_equal(c, t) for (c, _), t in zip(results, expected)])
+        count_error = np.mean([abs(c.sum() - t.sum()) for (c, _), t in zip(results, expected)])
+        pile_error = np.mean([abs(p - ref_p) for (_, p), (_, ref_p) in zip(results, reference)])
+        print(f"scale {scale:<5} | {summarize_ms(times)} | exact census {exact:6.1%} | count error {count_error:5.2f} | pile height error vs 1.0 {pile_error:.3f}")
+
+# --- Cat Tracking ---
+def synthetic_drops(rng, n_cats=30, fall_frames=2, fall_px=60):
+    """Boards of one episode: cats of a synthetic board dropped one at a time, each shown falling before it lands."""
+    _, mask, cats = synthetic_board(rng, n_cats)
+    board = synthetic_background(rng)
+    frames = [board.copy()]
+    for cx, cy, r, cat_id in cats:
+        for k in range(fall_frames, 0, -1):
+            frame = board.copy()
+            draw_synthetic_cat(frame, cx, max(r, cy - k * fall_px), r, cat_id)
+            frames.append(frame)
+        draw_synthetic_cat(board, cx, cy, r, cat_id)
+        frames += [board.copy(), board.copy()]
+    return frames, mask
+
+def bench_tracker(args):
+    """Census of the dirty-region tracker vs a full get_board_census() on every board of replayed episodes."""
+    rng = np.random.default_rng(args.seed)
+    template_index = compile_templates(*get_library(args, rng))
+    print(f"--- Cat tracker: {args.episodes} synthetic episodes, census vs full re-detection on every board ---")
+    updates = disagreements = worst = 0
+    full_times, tracker_times = [], []
+    stats = {}
+    for _ in range(args.episodes):
+        frames, mask = synthetic_drops(rng, args.cats)
+        tracker = CatTracker(template_index)
+        for frame in frames:
+            t0 = time.perf_counter()
+            reference = get_board_census(frame, mask, template_index)
+            full_times.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            census = tracker.update(frame, mask)
+            tracker_times.append(time.perf_counter() - t0)
+            off = int(np.abs(reference[0] - census[0]).sum())
+            updates += 1
+            disagreements += off > 0 or reference[1] != census[1]
+            worst = max(worst, off)
+        for key, value in tracker.stats.items(): stats[key] = stats.get(key, 0) + value
+    print(f"full    | {summarize_ms(full_times)}")
+    print(f"tracker | {summarize_ms(tracker_times)} | fast path {stats['fast_path']} | full detections {stats['full_detections']} | "
+          f"region updates {stats['region_updates']} of {stats['updates']}")
+    print(f"disagreements with full census: {disagreements} / {updates} | worst {worst} cats")
+    if disagreements > args.max_disagreements:
+        print("FAIL: tracker census drifts from full re-detection")
+        sys.exit(1)
+    if stats["region_updates"] < args.min_region_share * (stats["updates"] - stats["fast_path"]):
+        print(f"FAIL: fewer than {args.min_region_share:.0%} of the changed boards were region updates")
+        sys.exit(1)
+
+# --- Game-Over Detection ---
+def synthetic_restart_template():
+    template = np.full((60, 180, 3), (60, 160, 60), np.uint8)
+    cv2.putText(template, "RESTART", (18, 40), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+    return template
+
+def synthetic_game_frame(board, h=900, w=640):
+    frame = np.full((h, w, 3), (200, 220, 240), np.uint8)
+    frame[100:100 + board.shape[0], 40:40 + board.shape[1]] = board
+    return frame
+
+def show_restart(rng, frame, template, offset=(0, 0), overlay=True):
+    """Game-over screen: the board dimmed behind a panel (unless overlay=False) and the restart button, moved by offset."""
+    h, w = frame.shape[:2]
+    x, y = (w - template.shape[1]) // 2 + offset[0], h // 2 + offset[1]
+    frame = (frame // 2) if overlay else frame.copy()
+    noisy = template.astype(np.int16) + rng.integers(-6, 7, template.shape)
+    frame[y:y + template.shape[0], x:x + template.shape[1]] = noisy.clip(0, 255).astype(np.uint8)
+    return frame
+
+def synthetic_restart_frames(rng, n_episodes, h=900, w=640):
+    """
+    Episodes of full game frames, a board filling up cat by cat and then the game-over screen for two frames.
+    From halfway on the button sits elsewhere for good, as if the window had been moved.
+    Returns (template, [(frame, game_over)]).
+    """
+    template = synthetic_restart_template()
+    frames = []
+    for episode in range(n_episodes):
+        boards, _ = synthetic_drops(rng, int(rng.integers(3, 8)), fall_frames=1)
+        for board in boards[::2]: frames.append((synthetic_game_frame(board, h, w), False))
+        offset = (40, 25) if episode >= n_episodes // 2 else (0, 0)
+        over = show_restart(rng, frames[-1][0], template, offset)
+        frames += [(over, True), (over, True)]
+    return template, frames
+
+def moved_button_cases(rng, template, h=900, w=640):
+    """
+    Whether a detector that learned the button's place finds it moved on the first step it could: the
+    first game-over frame, or with no overlay to notice, the first check after a click had no effect.
+    """
+    boards, _ = synthetic_drops(rng, 6, fall_frames=1)
+    frames = [synthetic_game_frame(board, h, w) for board in boards]
+    results = {}
+    for name, overlay in (("overlay", True), ("stalled", False)):
+        detector = RestartDetector(template)
+        detector(show_restart(rng, frames[0], template))  # Learns the location
+        for frame in frames: detector(frame)
+        moved = show_restart(rng, frames[-1], template, (40, 25), overlay=overlay)
+        if overlay: found = detector(moved)[0] > GAME_OVER_THRESHOLD
+        else: found = detector(moved)[0] <= GAME_OVER_THRESHOLD and detector(moved, stalled=True)[0] > GAME_OVER_THRESHOLD
+        results[name] = found
+    return results
+
+def bench_restart(args):
+    """Latency and agreement of the ROI/hash game-over check vs a full-frame template match on every frame."""
+    rng = np.random.default_rng(args.seed)
+    template = cv2.imread("template_restart.png") if os.path.exists("template_restart.png") else None
+    frames = []
+    if template is not None and os.path.exists(args.frames):
+        for root, _, files in os.walk(args.frames):
+            for name in sorted(files):
+                if name.endswith(".png") and len(frames) < args.limit:
+                    img = cv2.imread(os.path.join(root, name))
+                    if img is not None: frames.append((img, None))
+    synthetic = not frames
+    if synthetic:
+        template, frames = synthetic_restart_frames(rng, args.limit)
+        print(f"--- Game over: {len(frames)} synthetic frames in {args.limit} episodes ---")
+    else:
+        print(f"--- Game over: {len(frames)} frames from {args.frames} ---")
+
+    detector = RestartDetector(template)
+    full_times, roi_times, disagreements, errors = [], [], 0, 0
+    for frame, game_over in frames * args.repeats:
+        t0 = time.perf_counter()
+        full_val, _ = find_template(frame, template)
+        full_times.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        roi_val, _ = detector(frame)
+        roi_times.append(time.perf_counter() - t0)
+        disagreements += (full_val > GAME_OVER_THRESHOLD) != (roi_val > GAME_OVER_THRESHOLD)
+        if game_over is not None: errors += (roi_val > GAME_OVER_THRESHOLD) != game_over
+    counts = detector.take_counts()
+    print(f"full frame | {summarize_ms(full_times)}")
+    print(f"roi + hash | {summarize_ms(roi_times)} | speedup {np.mean(full_times) / np.mean(roi_times):6.1f}x")
+    print(f"disagreements with full frame: {disagreements} / {len(roi_times)} | wrong vs drawn: {errors} | "
+          f"hash hits {counts['hash_hits']}, misses {counts['hash_misses']}, rechecked {counts['rechecks']}, full searches {counts['full_searches']}")
+    moved = moved_button_cases(rng, template if synthetic else synthetic_restart_template())
+    print("moved button found within one step: " + ", ".join(f"{name} {found}" for name, found in moved.items()))
+    if disagreements or errors or not all(moved.values()):
+        print("FAIL: game over missed or misreported")
+        sys.exit(1)
+
+# --- Capture ---
+def legacy_capture(shot, calib, scale):
+    """The capture path before Frame: copy the grab, convert all of it, then crop. Returns (arrays, bytes copied)."""
+    img = np.array(shot)
+    img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+    roi = calib["agent_view_roi"]
+    board_img = img[roi['y']:roi['y']+roi['h'], roi['x']:roi['x']+roi['w']]
+    board_obs = cv2.resize(board_img, (IMG_SIZE, IMG_SIZE))
+    census_board = scale_board(board_img, scale)
+    copied = 2 * img.nbytes + board_obs.nbytes + (census_board.nbytes if scale != 1.0 else 0)
+    return (img, board_obs, census_board), copied
+
+def frame_capture(shot, calib, scale, board_buffer):
+    """The zero-copy path the env uses: views of the grab, converting only the board. Returns (arrays, bytes copied)."""
+    frame = shot_frame(shot)
+    roi = calib["agent_view_roi"]
+    board_obs = frame.resize_bgr(roi, (IMG_SIZE, IMG_SIZE), dst=board_buffer)
+    if scale == 1.0: census_board = frame.bgr(roi)
+    else: census_board = frame.resize_bgr(roi, (int(round(roi['w'] * scale)), int(round(roi['h'] * scale))), interpolation=cv2.INTER_AREA)
+    return (frame, board_obs, census_board), frame.bytes_copied
+
+def bench_live_capture(args):
+    """Grab latency and peak allocation of every capture backend on the current X display."""
+    region = {"left": 0, "top": 0, "width": 640, "height": 900}
+    calib = load_calibration()
+    if calib is not None and "game_width" in calib: region.update(width=calib["game_width"], height=calib["game_height"])
+    print(f"--- Live capture: {args.live} grabs of {region['width']}x{region['height']} on {os.environ.get('DISPLAY')} ---")
+    for name in CAPTURE_BACKENDS:
+        for rate_hz in sorted({0.0, args.hz}):
+            capture = make_capture(region, name, rate_hz=rate_hz)
+            times, peaks, ages, unchanged = [], [], [], 0
+            for _ in range(args.live):
+                time.sleep(0.02)  # Stand-in for a step's work, so a background capture has something to hide
+                tracemalloc.start()
+                t0 = time.perf_counter()
+                frame = capture.grab()
+                times.append(time.perf_counter() - t0)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+                ages.append(t0 - frame.captured_at)
+                unchanged += not frame.changed
+            capture.close()
+            label = f"{name} @ {rate_hz:g} Hz" if rate_hz else name
+            print(f"{label:<14} | {summarize_ms(times)} | peak alloc {np.mean(peaks) / 1e6:6.2f} MB/grab | "
+                  f"frame age {np.mean(ages) * 1000:6.2f} ms | unchanged {unchanged}")
+
+def bench_capture(args):
+    """Latency, bytes copied and peak Python-heap allocation per step of the old and zero-copy capture paths."""
+    if args.live: return bench_live_capture(args)
+    rng = np.random.default_rng(args.seed)
+    calib = load_calibration()
+    frames = []
+    if calib is not None and os.path.exists(args.frames):
+        for root, _, files in os.walk(args.frames):
+            for name in sorted(files):
+                img = cv2.imread(os.path.join(root, name)) if name.endswith(".png") else None
+                if img is not None and img.shape[:2] == (calib["game_height"], calib["game_width"]) and len(frames) < args.limit: frames.append(img)
+    if not frames:
+        calib = {"agent_view_roi": {"x": 40, "y": 100, "w": 560, "h": 700}}
+        for _ in range(args.limit):
+            frame = np.full((900, 640, 3), (200, 220, 240), np.uint8)
+            frame[100:800, 40:600] = synthetic_board(rng, n_cats=int(rng.integers(5, 40)))[0]
+            frames.append(frame)
+    # mss hands out a fresh bytearray per grab; building them is the grab's cost, not the pipeline's
+    raws = [bytearray(cv2.cvtColor(f, cv2.COLOR_BGR2BGRA).tobytes()) for f in frames]
+    print(f"--- Capture: {len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]}, perception scale {args.scale} ---")
+
+    board_buffer = np.zeros((IMG_SIZE, IMG_SIZE, 3), np.uint8)
+    paths = {"legacy": lambda shot: legacy_capture(shot, calib, args.scale),
+             "zero-copy": lambda shot: frame_capture(shot, calib, args.scale, board_buffer)}
+    outputs = {}
+    for name, run in paths.items():
+        times, copied, peaks = [], [], []
+        outputs[name] = []
+        for raw, frame in zip(raws, frames):
+            shot = ScreenShot.from_size(raw, frame.shape[1], frame.shape[0])
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            arrays, n = run(shot)
+            times.append(time.perf_counter() - t0)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+            copied.append(n)
+            outputs[name].append((arrays[1].copy(), arrays[2].copy()))
+        print(f"{name:<9} | {summarize_ms(times)} | copied {np.mean(copied) / 1e6:6.2f} MB/step | peak alloc {np.mean(peaks) / 1e6:6.2f} MB/step")
+    same = all(np.array_equal(a[0], b[0]) and np.array_equal(a[1], b[1]) for a, b in zip(outputs["legacy"], outputs["zero-copy"]))
+    print(f"board and census inputs identical: {same}")
+
+class ScreenSct:
+    """Stand-in for an mss instance that grabs from an in-memory BGRA screen."""
+    def __init__(self, screen):
+        self.screen = screen
+
+    def grab(self, monitor):
+        x, y, w, h = monitor['left'], monitor['top'], monitor['width'], monitor['height']
+        return ScreenShot.from_size(bytearray(self.screen[y:y+h, x:x+w].tobytes()), w, h)
+
+def bench_reset_frames(args):
+    """
+    What reset() sees right after a game over with the capture thread on: the screen switches from the game-over
+    frame to a new board, and ~10 ms later a grab (as reset() did) vs a grab(after=now) (as it does) is taken.
+    """
+    rng = np.random.default_rng(args.seed)
+    template, frames = synthetic_restart_frames(rng, 1)
+    over = cv2.cvtColor(next(f for f, game_over in frames if game_over), cv2.COLOR_BGR2BGRA)
+    new = cv2.cvtColor(synthetic_game_frame(synthetic_background(rng)), cv2.COLOR_BGR2BGRA)
+    region = {"left": 0, "top": 0, "width": over.shape[1], "height": over.shape[0]}
+    print(f"--- Reset frames: {args.trials} resets right after a game over, capture thread at {args.hz:g} Hz ---")
+    stale = {}
+    for mode in ("grab()", "grab(after)"):
+        sct = ScreenSct(over)
+        capture = ThreadedCapture(MssCapture(region, sct), args.hz)
+        stale[mode] = unchanged = 0
+        times = []
+        try:
+            for _ in range(args.trials):
+                sct.screen = over
+                capture.grab(after=time.perf_counter())  # The step that saw the game over
+                sct.screen = new  # The restart click took effect
+                time.sleep(0.01)
+                t0 = time.perf_counter()
+                frame = capture.grab(after=t0 if mode == "grab(after)" else None)
+                times.append(time.perf_counter() - t0)
+                unchanged += not frame.changed
+                stale[mode] += not np.array_equal(frame.bgra, new)
+        finally:
+            capture.close()
+        print(f"{mode:<11} | {summarize_ms(times)} | changed=False {unchanged} / {args.trials} | game-over pixels {stale[mode]} / {args.trials}")
+    if stale["grab(after)"]:
+        print("FAIL: reset() would observe the game-over frame")
+        sys.exit(1)
+
+def bench_capture_rois(args):
+    """Bytes captured and grab latency per step for the whole game region vs the merged perception ROIs."""
+    rng = np.random.default_rng(args.seed)
+    calib = load_calibration()
+    template = cv2.imread("template_restart.png") if os.path.exists("template_restart.png") else None
+    frame = None
+    if calib is not None and template is not None and os.path.exists(args.frames):
+        paths = [os.path.join(root, name) for root, _, files in os.walk(args.frames) for name in sorted(files) if name.endswith(".png")]
+        for path in paths:
+            img = cv2.imread(path)
+            if img is not None and img.shape[:2] == (calib["game_height"], calib["game_width"]):
+                frame = img
+                break
+    if frame is not None:
+        rois = [roi_rect(calib[k]) for k in ("agent_view_roi", "next_cat_roi", "score_roi")]
+        x, y = find_template(frame, template)[1]
+        restart = (x, y, template.shape[1], template.shape[0])
+    else:
+        template, frames = synthetic_restart_frames(rng, 1)
+        frame = next(f for f, game_over in frames if game_over)
+        rois = [(40, 100, 560, 700), (20, 20, 80, 80), (400, 20, 200, 50)]
+        restart = (*find_template(frame, template)[1], template.shape[1], template.shape[0])
+    print(f"--- Capture ROIs: {frame.shape[1]}x{frame.shape[0]} game region, {args.limit} grabs per canvas scale ---")
+    for scale in args.canvas_scales:
+        game = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_NEAREST)
+        sct = ScreenSct(cv2.cvtColor(game, cv2.COLOR_BGR2BGRA))
+        region = {"left": 0, "top": 0, "width": game.shape[1], "height": game.shape[0]}
+        wanted = [tuple(int(round(v * scale)) for v in r) for r in rois + [restart]]
+        rects = merge_rects(wanted)
+        for label, grab_rects in (("full", None), ("rois", rects)):
+            capture = MssCapture(region, sct)
+            times, captured = [], []
+            for _ in range(args.limit):
+                t0 = time.perf_counter()
+                grabbed = capture.grab(rects=grab_rects)
+                times.append(time.perf_counter() - t0)
+                captured.append(grabbed.bytes_captured)
+            same = all(np.array_equal(roi_slice(grabbed.bgra, dict(x=x, y=y, w=w, h=h)), sct.screen[y:y+h, x:x+w]) for x, y, w, h in wanted)
+            print(f"{scale:g}x {label:<4} | {summarize_ms(times)} | captured {np.mean(captured) / 1e6:6.2f} MB/step | "
+                  f"{len(grab_rects or [region])} grabs | ROIs identical: {same}")
+
+# --- Nested Circle Suppression ---
+def filter_nested_circles_loop(circles):
+    """The original O(n^2) Python double loop, kept as the reference for filter_nested_circles."""
+    discarded_indices = set()
+    for i, c1 in enumerate(circles):
+        if i in discarded_indices: continue
+        for j, c2 in enumerate(circles):
+            if i == j or j in discarded_indices: continue
+            smaller, larger = (c1, c2) if c1[2] < c2[2] else (c2, c1)
+            smaller_idx, larger_idx = (i, j) if c1[2] < c2[2] else (j, i)
+            intersection = circle_intersection_area(smaller, larger)
+            area_smaller = np.pi * float(smaller[2])**2
+            if area_smaller == 0: continue
+            if intersection / area_smaller > 0.8:
+                discarded_indices.add(smaller_idx)
+    return [c for i, c in enumerate(circles) if i not in discarded_indices]
+
+def synthetic_candidates(rng, n, h=700, w=560):
+    """Hough-like candidates: distinct cats plus jittered duplicates, exact repeats and nested eyes."""
+    circles = []
+    while len(circles) < n:
+        r = int(rng.integers(15, 180))
+        x, y = int(rng.integers(0, w)), int(rng.integers(0, h))
+        circles.append((x, y, r))
+        kind = rng.integers(0, 4)
+        if kind == 0: circles.append((x + int(rng.integers(-3, 4)), y + int(rng.integers(-3, 4)), r + int(rng.integers(-3, 4))))
+        elif kind == 1: circles.append((x, y, r))
+        elif kind == 2 and r > 40: circles.append((x + r // 3, y - r // 4, int(rng.integers(15, r // 2))))
+    circles = np.array(circles[:n], dtype=np.int64)
+    circles[:, 2] = np.maximum(circles[:, 2], 0)
+    return np.uint16(circles.clip(0, None))
+
+def bench_nested(args):
+    rng = np.random.default_rng(args.seed)
+    print(f"--- Nested circle suppression: loop vs vectorized, {args.repeats} candidate sets per size ---")
+    for n in args.sizes:
+        loop_times, vec_times, mismatches = [], [], 0
+        for _ in range(args.repeats):
+            circles = synthetic_candidates(rng, n)
+            t0 = time.perf_counter()
+            expected = filter_nested_circles_loop(circles)
+            loop_times.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            kept = filter_nested_circles(circles)
+            vec_times.append(time.perf_counter() - t0)
+            mismatches += not np.array_equal(np.array(expected).reshape(-1, 3), np.array(kept).reshape(-1, 3))
+        print(f"n={n:<4} | loop {summarize_ms(loop_times)}")
+        print(f"{'':<6} | vec  {summarize_ms(vec_times)} | speedup {np.mean(loop_times) / np.mean(vec_times):6.1f}x | mismatched kept sets: {mismatches}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless perception benchmarks.")
+    parser.add_argument("--frames", type=str, default="highscores", help="Directory of saved full-game screenshots")
+    parser.add_argument("--templates", type=str, default="./cat_templates", help="Cat template directory")
+    parser.add_argument("--limit", type=int, default=20, help="Maximum number of boards to load")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for synthetic boards")
+    subparsers = parser.add_subparsers(dest="bench", required=True)
+
+    p = subparsers.add_parser("dominant-color", help="Agreement and latency of the dominant color backends vs k-means")
+    p.add_argument("--tol", type=float, default=20.0, help="Max BGR distance counted as agreeing with k-means")
+    p.set_defaults(func=bench_dominant_color)
+
+    p = subparsers.add_parser("hough", help="Latency of the shared-blur Hough bands and their agreement with separate passes")
+    p.set_defaults(func=bench_hough)
+
+    p = subparsers.add_parser("classifier", help="Agreement and latency of the color LUT classifier vs dominant colors")
+    p.set_defaults(func=bench_classifier)
+
+    p = subparsers.add_parser("detector", help="Candidate recall and latency of the board detector backends")
+    p.add_argument("--tol", type=float, default=4.0, help="Max center and radius error (px) counted as a match")
+    p.set_defaults(func=bench_detector)
+
+    p = subparsers.add_parser("scale", help="Census accuracy and latency at reduced perception scales")
+    p.add_argument("--scales", type=float, nargs="+", default=[0.75, 0.5, 0.25], help="Perception scales to compare against 1.0")
+    p.add_argument("--detector", type=str, default="hough", help="Board detector backend")
+    p.set_defaults(func=bench_scale)
+
+    p = subparsers.add_parser("tracker", help="Census agreement and latency of the dirty-region cat tracker vs full re-detection")
+    p.add_argument("--episodes", type=int, default=8, help="Synthetic episodes to replay")
+    p.add_argument("--cats", type=int, default=30, help="Cats dropped per episode")
+    p.add_argument("--max-disagreements", type=int, default=0, help="Fail if more boards than this disagree with full re-detection")
+    p.add_argument("--min-region-share", type=float, default=0.2, help="Fail if fewer changed boards than this share are region updates")
+    p.set_defaults(func=bench_tracker)
+
+    p = subparsers.add_parser("restart", help="Latency and agreement of the learned-location game-over check vs full-frame matching")
+    p.add_argument("--repeats", type=int, default=1, help="Passes over the frames")
+    p.set_defaults(func=bench_restart)
+
+    p = subparsers.add_parser("capture", help="Bytes copied, peak allocation and latency of the zero-copy capture path vs the old one")
+    p.add_argument("--scale", type=float, default=1.0, help="Perception scale of the census board")
+    p.add_argument("--live", type=int, default=0, help="Instead, time this many grabs per capture backend on $DISPLAY")
+    p.add_argument("--hz", type=float, default=0.0, help="With --live, also time each backend on a background thread at this rate")
+    p.set_defaults(func=bench_capture)
+
+    p = subparsers.add_parser("reset", help="Whether reset() right after a game over observes a fresh frame with the capture thread on")
+    p.add_argument("--trials", type=int, default=40, help="Resets to simulate")
+    p.add_argument("--hz", type=float, default=20.0, help="Capture thread rate")
+    p.set_defaults(func=bench_reset_frames)
+
+    p = subparsers.add_parser("rois", help="Bytes captured per step grabbing only the perception ROIs vs the whole game region")
+    p.add_argument("--canvas-scales", type=float, nargs="+", default=[1.0, 2.0], help="Game region sizes to compare, relative to the frames")
+    p.set_defaults(func=bench_capture_rois)
+
+    p = subparsers.add_parser("nested", help="Micro-benchmark of nested-circle suppression vs the original loop")
+    p.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200], help="Candidate counts to benchmark")
+    p.add_argument("--repeats", type=int, default=20, help="Candidate sets per size")
+    p.set_defaults(func=bench_nested)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import time
+import pickle
+import argparse
+import numpy as np
+import gymnasium as gym
+from gymnasium import spaces
+from multiprocessing.reduction import ForkingPickler
+from stable_baselines3.common.vec_env import SubprocVecEnv, VecFrameStack
+from shm_vec_env import ShmVecEnv
+
+# Transport benchmark: SubprocVecEnv + VecFrameStack (the old training setup) vs ShmVecEnv, on a synthetic env
+# with FitCatsEnv's spaces and a FitCats-sized info dict, so the numbers are the vec env's own per-step cost.
+# Runs headless; no game, X server or torch needed.
+
+MAX_CAT_TYPES = 15
+IMG_SIZE = 160
+N_STACK = 4
+
+class SyntheticFitCatsEnv(gym.Env):
+    """FitCatsEnv's observation and action spaces over a seeded pool of random boards, ending every episode_len steps."""
+    def __init__(self, rank, episode_len=50, step_ms=0.0, pool=8):
+        self.observation_space = spaces.Dict({
+            "board": spaces.Box(low=0, high=255, shape=(IMG_SIZE, IMG_SIZE, 3), dtype=np.uint8),
+            "next_cat_type": spaces.Box(low=0, high=1, shape=(MAX_CAT_TYPES,), dtype=np.float32),
+            "time_since_click": spaces.Box(low=0, high=np.inf, shape=(1,), dtype=np.float32),
+            "cat_census": spaces.Box(low=0, high=100, shape=(MAX_CAT_TYPES,), dtype=np.float32),
+            "pile_height": spaces.Box(low=0, high=1.0, shape=(1,), dtype=np.float32)
+        })
+        self.action_space = spaces.MultiDiscrete([IMG_SIZE, 2])
+        self.rng = np.random.default_rng(rank)
+        self.boards = self.rng.integers(0, 256, (pool, IMG_SIZE, IMG_SIZE, 3), dtype=np.uint8)
+        self.episode_len, self.step_ms = episode_len, step_ms
+        self.steps = 0
+
+    def _obs(self):
+        return {"board": self.boards[self.rng.integers(len(self.boards))].copy(),
+                "next_cat_type": np.eye(MAX_CAT_TYPES, dtype=np.float32)[self.rng.integers(MAX_CAT_TYPES)],
+                "time_since_click": self.rng.random(1, dtype=np.float32),
+                "cat_census": self.rng.integers(0, 5, MAX_CAT_TYPES).astype(np.float32),
+                "pile_height": self.rng.random(1, dtype=np.float32)}
+
+    def reset(self, seed=None, options=None):
+        super().reset(seed=seed)
+        self.steps = 0
+        return self._obs(), {}
+
+    def step(self, action):
+        if self.step_ms: time.sleep(self.step_ms / 1000.0)
+        self.steps += 1
+        # Roughly the keys FitCatsEnv reports every step (game/, perception/, input/, control/, step/)
+        info = {f"perception/metric_{i}": float(self.rng.random()) for i in range(24)}
+        info.update({"game/score": self.steps * 10, "game/cat_count": 12.0, "game/action_x": float(action[0]) / IMG_SIZE,
+                     "game/did_click": int(action[1]), "step/wall_ms": 1.0})
+        return self._obs(), float(action[0] % 7), self.steps >= self.episode_len, False, info
+
+def make_synthetic(rank, episode_len, step_ms):
+    return lambda: SyntheticFitCatsEnv(rank, episode_len, step_ms)
+
+class CountingSubprocVecEnv(SubprocVecEnv):
+    """SubprocVecEnv that counts the bytes step() pickles through its pipes (send/recv do the same pickling)."""
+    ipc_bytes = 0
+
+    def step_async(self, actions):
+        for remote, action in zip(self.remotes, actions):
+            msg = bytes(ForkingPickler.dumps(("step", action)))
+            self.ipc_bytes += len(msg)
+            remote.send_bytes(msg)
+        self.waiting = True
+
+    def step_wait(self):
+        results = []
+        for remote in self.remotes:
+            msg = remote.recv_bytes()
+            self.ipc_bytes += len(msg)
+            results.append(pickle.loads(msg))
+        self.waiting = False
+        obs, rews, dones, infos, self.reset_infos = zip(*results)
+        obs = {key: np.stack([o[key] for o in obs]) for key in self.observation_space.spaces}
+        return obs, np.stack(rews), np.stack(dones), infos
+
+def run(venv, actions):
+    """Steps venv through actions. Returns (per-step seconds, IPC bytes per step, [(obs, rewards, dones, terminal obs)])."""
+    out = [({k: v.copy() for k, v in venv.reset().items()}, None, None, {})]
+    base = venv.unwrapped if isinstance(venv, VecFrameStack) else venv
+    base.ipc_bytes = 0
+    times = []
+    for a in actions:
+        t0 = time.perf_counter()
+        obs, rewards, dones, infos = venv.step(a)
+        times.append(time.perf_counter() - t0)
+        terminal = {i: info["terminal_observation"] for i, info in enumerate(infos) if "terminal_observation" in info}
+        out.append(({k: v.copy() for k, v in obs.items()}, rewards.copy(), dones.copy(), terminal))
+    return times, base.ipc_bytes / len(actions), out
+
+def same_outputs(a, b):
+    for (obs_a, rew_a, done_a, term_a), (obs_b, rew_b, done_b, term_b) in zip(a, b):
+        if any(not np.array_equal(obs_a[k], obs_b[k]) for k in obs_a): return False
+        if rew_a is not None and not (rew_a.dtype == rew_b.dtype and np.array_equal(rew_a, rew_b) and np.array_equal(done_a, done_b)): return False
+        if term_a.keys() != term_b.keys(): return False
+        if any(not np.array_equal(term_a[i][k], term_b[i][k]) for i in term_a for k in term_a[i]): return False
+    return True
+
+def summarize_ms(times):
+    t = np.asarray(times) * 1000.0
+    return f"mean {t.mean():7.3f} ms | p50 {np.percentile(t, 50):7.3f} ms | p95 {np.percentile(t, 95):7.3f} ms"
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-step overhead and IPC bytes of ShmVecEnv vs SubprocVecEnv + VecFrameStack.")
+    parser.add_argument("--num-envs", type=int, nargs="+", default=[2, 4, 8], help="Env counts to compare")
+    parser.add_argument("--steps", type=int, default=500, help="Vec env steps per run")
+    parser.add_argument("--episode-len", type=int, default=50, help="Steps per synthetic episode (exercises terminal observations)")
+    parser.add_argument("--step-ms", type=float, default=0.0, help="Time each synthetic env step sleeps")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the actions")
+    args = parser.parse_args()
+
+    print(f"--- Vec env transport: {args.steps} steps, n_stack {N_STACK}, episodes of {args.episode_len} steps ---")
+    for n in args.num_envs:
+        rng = np.random.default_rng(args.seed)
+        actions = np.stack([rng.integers(0, IMG_SIZE, (args.steps, n)), rng.integers(0, 2, (args.steps, n))], axis=-1)
+        fns = [make_synthetic(i, args.episode_len, args.step_ms) for i in range(n)]
+        venvs = {"subproc": lambda: VecFrameStack(CountingSubprocVecEnv(fns), n_stack=N_STACK),
+                 "shm": lambda: ShmVecEnv(fns, n_stack=N_STACK)}
+        outputs = {}
+        for name, make in venvs.items():
+            venv = make()
+            try:
+                times, ipc, outputs[name] = run(venv, actions)
+            finally:
+                venv.close()
+            print(f"{n} envs {name:<8} | {summarize_ms(times)} | IPC {ipc / 1e3:8.1f} kB/step")
+        print(f"{n} envs observations, rewards, dones and terminal observations identical: {same_outputs(outputs['subproc'], outputs['shm'])}")
+
+if __name__ == "__main__":
+    main()
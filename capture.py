@@ -0,0 +1,437 @@
+import os
+import time
+import threading
+import ctypes
+import ctypes.util
+import cv2
+import mss
+import numpy as np
+
+# Zero-copy screen capture. An mss grab already owns its pixels in a bytearray; Frame wraps that buffer as a
+# BGRA array without copying it, hands out ROIs as views, and only converts (copies) the regions asked for.
+# On the agents' own X displays (Xephyr/Xvfb) the "xshm" backend goes further: one shared-memory segment per
+# display, attached once, and a ring of preallocated frames it is copied into.
+
+CAPTURE_BACKEND = os.environ.get("FITCATS_CAPTURE", "mss")
+CAPTURE_DAMAGE = os.environ.get("FITCATS_CAPTURE_DAMAGE", "0") == "1"  # xshm only: skip grabs of an undamaged region
+CAPTURE_RING_SIZE = 3  # Frames a consumer can hold on to before the ring overwrites them
+CAPTURE_HZ = float(os.environ.get("FITCATS_CAPTURE_HZ", "0"))  # > 0 grabs continuously on a background thread at this rate
+CAPTURE_ROIS = os.environ.get("FITCATS_CAPTURE_ROIS", "0") == "1"  # Grab only the rects perception reads, not the whole region
+CAPTURE_MERGE_PX = 16384  # Uncovered pixels worth grabbing to save a round trip when two rects are merged
+
+def roi_slice(img, roi):
+    """View of img over a calibration ROI dict (x, y, w, h)."""
+    return img[roi['y']:roi['y']+roi['h'], roi['x']:roi['x']+roi['w']]
+
+def roi_rect(roi):
+    """Calibration ROI dict as an (x, y, w, h) rect."""
+    return (roi['x'], roi['y'], roi['w'], roi['h'])
+
+def _bounding_rect(a, b):
+    x, y = min(a[0], b[0]), min(a[1], b[1])
+    return (x, y, max(a[0] + a[2], b[0] + b[2]) - x, max(a[1] + a[3], b[1] + b[3]) - y)
+
+def _overlap_area(a, b):
+    w = min(a[0] + a[2], b[0] + b[2]) - max(a[0], b[0])
+    h = min(a[1] + a[3], b[1] + b[3]) - max(a[1], b[1])
+    return max(w, 0) * max(h, 0)
+
+def _merge_waste(a, b):
+    """Pixels the bounding rect of a and b grabs that neither of them covers."""
+    _, _, w, h = _bounding_rect(a, b)
+    return w * h - a[2] * a[3] - b[2] * b[3] + _overlap_area(a, b)
+
+def merge_rects(rects, slack_px=CAPTURE_MERGE_PX):
+    """
+    Capture rects (x, y, w, h) covering rects. The pair whose bounding rect adds the fewest pixels neither of
+    them covers is merged, as long as that is at most slack_px: each grab is a round trip to the X server, which
+    costs about as much as copying that many more pixels. Returns a sorted tuple.
+    """
+    rects = list(dict.fromkeys(tuple(r) for r in rects))
+    while len(rects) > 1:
+        waste, i, j = min((_merge_waste(a, b), i, j) for i, a in enumerate(rects) for j, b in enumerate(rects) if i < j)
+        if waste > slack_px: break
+        rects[i] = _bounding_rect(rects[i], rects.pop(j))
+    return tuple(sorted(rects))
+
+class Frame:
+    """
+    One grabbed frame. `bgra` is a view of the capture's buffer; `bytes_copied` counts what conversions have
+    copied out of it so far. `captured_at` is the perf_counter time of the grab, and `changed` is False when
+    the backend knows the region is unchanged since the previous frame. A partial frame grabbed only `rects`
+    (x, y, w, h); the rest of `bgra` holds whatever an earlier grab left there. `bytes_captured` is what the
+    grab read from the screen.
+    """
+    def __init__(self, bgra, captured_at=None, changed=True, owner=None, rects=None):
+        self.owner = owner  # Keeps the buffer alive for as long as the views are
+        self.bgra = bgra
+        self.captured_at = time.perf_counter() if captured_at is None else captured_at
+        self.changed = changed
+        self.rects = rects
+        self.bytes_captured = bgra.nbytes if rects is None else sum(w * h for _, _, w, h in rects) * bgra.shape[2]
+        self.bytes_copied = 0
+        self._bgr = None
+
+    def covers(self, rects):
+        """Whether this frame grabbed every pixel of rects (None: the whole region)."""
+        return self.rects is None or self.rects == rects
+
+    @property
+    def shape(self):
+        return self.bgra.shape[:2] + (3,)
+
+    def roi(self, roi):
+        """BGRA view of an ROI, no copy."""
+        return roi_slice(self.bgra, roi)
+
+    def bgr(self, roi=None, dst=None):
+        """BGR copy of an ROI, or of the whole frame (converted once and kept) when roi is None. dst is an optional output buffer."""
+        if roi is None and self._bgr is not None: return self._bgr
+        src = self.bgra if roi is None else self.roi(roi)
+        out = cv2.cvtColor(src, cv2.COLOR_BGRA2BGR, dst=dst)
+        self.bytes_copied += out.nbytes
+        if roi is None: self._bgr = out
+        return out
+
+    def resize_bgr(self, roi, size, dst=None, interpolation=cv2.INTER_LINEAR):
+        """BGR ROI resized to size (w, h): resized in BGRA first, so only the small result is converted, into dst if given."""
+        small = cv2.resize(self.roi(roi), size, interpolation=interpolation)
+        out = cv2.cvtColor(small, cv2.COLOR_BGRA2BGR, dst=dst)
+        self.bytes_copied += small.nbytes + out.nbytes
+        return out
+
+def shot_frame(shot, captured_at=None):
+    """Frame over an mss ScreenShot's own buffer."""
+    return Frame(np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4), captured_at=captured_at, owner=shot)
+
+def grab_frame(sct, region):
+    """Grabs region with an mss instance as a Frame."""
+    t = time.perf_counter()
+    return shot_frame(sct.grab(region), captured_at=t)
+
+# --- Backends ---
+# A capture grabs one region ({'left', 'top', 'width', 'height'}, as mss takes it) and has
+# grab(after=None, rects=None) -> Frame, latest (the last Frame or None), take_counts() and close().
+# Synchronous backends grab on the call, so `after`, the earliest perf_counter time the caller accepts a frame
+# from, is always met. `rects` (x, y, w, h, relative to the region; see merge_rects) limits the grab to those
+# parts of the region: they are copied into a canvas of the region's size that the next partial grab reuses.
+class MssCapture:
+    """mss's generic grab: a new buffer per full frame, so those never go stale, but every grab allocates."""
+    def __init__(self, region, sct=None):
+        self.region = region
+        self.sct = sct  # Without one, an mss instance is made by the first grab, on the thread that grabs
+        self.latest = self.canvas = None
+
+    def grab(self, after=None, rects=None):
+        if self.sct is None: self.sct = mss.mss()
+        if rects is None:
+            self.latest = grab_frame(self.sct, self.region)
+            return self.latest
+        t = time.perf_counter()
+        if self.canvas is None: self.canvas = np.zeros((self.region['height'], self.region['width'], 4), dtype=np.uint8)
+        for x, y, w, h in rects:
+            shot = self.sct.grab({'left': self.region['left'] + x, 'top': self.region['top'] + y, 'width': w, 'height': h})
+            np.copyto(self.canvas[y:y+h, x:x+w], np.frombuffer(shot.raw, dtype=np.uint8).reshape(h, w, 4))
+        self.latest = Frame(self.canvas, captured_at=t, owner=self, rects=rects)
+        return self.latest
+
+    def take_counts(self):
+        return {}
+
+    def close(self):
+        pass
+
+# Xlib, MIT-SHM and (optionally) Damage/XFixes through ctypes
+class XImage(ctypes.Structure):
+    _fields_ = [("width", ctypes.c_int), ("height", ctypes.c_int), ("xoffset", ctypes.c_int), ("format", ctypes.c_int),
+                ("data", ctypes.c_void_p), ("byte_order", ctypes.c_int), ("bitmap_unit", ctypes.c_int),
+                ("bitmap_bit_order", ctypes.c_int), ("bitmap_pad", ctypes.c_int), ("depth", ctypes.c_int),
+                ("bytes_per_line", ctypes.c_int), ("bits_per_pixel", ctypes.c_int),
+                ("red_mask", ctypes.c_ulong), ("green_mask", ctypes.c_ulong), ("blue_mask", ctypes.c_ulong)]
+    # Xlib's private fields follow; images are only ever handled through pointers
+
+class XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [("shmseg", ctypes.c_ulong), ("shmid", ctypes.c_int), ("shmaddr", ctypes.c_void_p), ("readOnly", ctypes.c_int)]
+
+class XRectangle(ctypes.Structure):
+    _fields_ = [("x", ctypes.c_short), ("y", ctypes.c_short), ("width", ctypes.c_ushort), ("height", ctypes.c_ushort)]
+
+X_ERROR_HANDLER = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+Z_PIXMAP, ALL_PLANES = 2, ctypes.c_ulong(-1).value
+IPC_PRIVATE, IPC_CREAT, IPC_RMID = 0, 0o1000, 0
+X_DAMAGE_REPORT_NON_EMPTY = 3  # One event when the damage goes from empty to non-empty, so the queue stays short
+X_EVENT_SIZE = 192             # sizeof(XEvent)
+
+# Xlib's default error handler exits the process on any protocol error; while a capture is open, errors are counted instead
+_x_errors = []
+_x_error_handler = X_ERROR_HANDLER(lambda dpy, event: _x_errors.append(event) or 0)
+
+def _load_library(name, functions):
+    path = ctypes.util.find_library(name)
+    if path is None: raise OSError(f"lib{name} not found")
+    lib = ctypes.CDLL(path)
+    for fn, (restype, argtypes) in functions.items():
+        getattr(lib, fn).restype, getattr(lib, fn).argtypes = restype, argtypes
+    return lib
+
+def _load_xshm():
+    vp, ul, i = ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int
+    x11 = _load_library("X11", {
+        "XOpenDisplay": (vp, [ctypes.c_char_p]), "XCloseDisplay": (i, [vp]), "XDefaultScreen": (i, [vp]),
+        "XDefaultRootWindow": (ul, [vp]), "XDefaultVisual": (vp, [vp, i]), "XDefaultDepth": (i, [vp, i]),
+        "XSync": (i, [vp, i]), "XFree": (i, [vp]), "XPending": (i, [vp]), "XNextEvent": (i, [vp, vp]),
+        "XSetErrorHandler": (vp, [X_ERROR_HANDLER]),
+    })
+    xext = _load_library("Xext", {
+        "XShmQueryExtension": (i, [vp]),
+        "XShmCreateImage": (ctypes.POINTER(XImage), [vp, vp, ctypes.c_uint, i, vp, ctypes.POINTER(XShmSegmentInfo), ctypes.c_uint, ctypes.c_uint]),
+        "XShmAttach": (i, [vp, ctypes.POINTER(XShmSegmentInfo)]), "XShmDetach": (i, [vp, ctypes.POINTER(XShmSegmentInfo)]),
+        "XShmGetImage": (i, [vp, ul, ctypes.POINTER(XImage), i, i, ul]),
+    })
+    libc = _load_library("c", {
+        "shmget": (i, [i, ctypes.c_size_t, i]), "shmat": (vp, [i, vp, i]), "shmdt": (i, [vp]), "shmctl": (i, [i, i, vp]),
+    })
+    return x11, xext, libc
+
+def _load_xdamage():
+    vp, ul, i = ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int
+    xdamage = _load_library("Xdamage", {
+        "XDamageQueryExtension": (i, [vp, ctypes.POINTER(i), ctypes.POINTER(i)]), "XDamageCreate": (ul, [vp, ul, i]),
+        "XDamageSubtract": (None, [vp, ul, ul, ul]), "XDamageDestroy": (None, [vp, ul]),
+    })
+    xfixes = _load_library("Xfixes", {
+        "XFixesCreateRegion": (ul, [vp, vp, i]), "XFixesDestroyRegion": (None, [vp, ul]),
+        "XFixesFetchRegion": (ctypes.POINTER(XRectangle), [vp, ul, ctypes.POINTER(i)]),
+    })
+    return xdamage, xfixes
+
+class XShmCapture:
+    """
+    Persistent MIT-SHM capture of one region of a local X display. The server writes every grab into a
+    shared-memory segment, attached once per grab size, which is then copied into the next slot of a ring of
+    preallocated frames: a grab allocates nothing, and a Frame stays valid until the ring comes back around to it.
+    With damage=True the X Damage extension tracks the root window; when nothing inside the grabbed rects was drawn
+    since the previous grab, grab() skips the server round trip and returns the previous pixels with changed=False.
+    """
+    def __init__(self, region, display=None, ring_size=CAPTURE_RING_SIZE, damage=CAPTURE_DAMAGE):
+        self.x11, self.xext, self.libc = _load_xshm()
+        self.region = region
+        self.x, self.y, self.width, self.height = region['left'], region['top'], region['width'], region['height']
+        self.latest = None
+        self.dpy = self.x11.XOpenDisplay(display.encode() if display else None)
+        if not self.dpy: raise RuntimeError(f"Cannot open X display {display or os.environ.get('DISPLAY')}")
+        self.previous_error_handler = self.x11.XSetErrorHandler(_x_error_handler)
+        self.images = {}  # (w, h) -> (XImage pointer, XShmSegmentInfo, BGRA view of the segment)
+        self.damage = self.damage_parts = None
+        try:
+            if not self.xext.XShmQueryExtension(self.dpy): raise RuntimeError("X server has no MIT-SHM extension")
+            screen = self.x11.XDefaultScreen(self.dpy)
+            self.root = self.x11.XDefaultRootWindow(self.dpy)
+            self.visual, self.depth = self.x11.XDefaultVisual(self.dpy, screen), self.x11.XDefaultDepth(self.dpy, screen)
+            self._shm_image(self.width, self.height)
+        except Exception:
+            self.close()
+            raise
+        if damage:
+            try:
+                self._create_damage()
+            except (OSError, RuntimeError) as e:
+                print(f"Warning: X Damage unavailable ({e}); grabbing every frame.")
+        self.ring = np.empty((ring_size, self.height, self.width, 4), dtype=np.uint8)
+        self.ring_idx = 0
+        self.event = ctypes.create_string_buffer(X_EVENT_SIZE)
+
+    def _shm_image(self, width, height):
+        """The shared-memory image grabs of this size go into, attached on first use."""
+        if (width, height) in self.images: return self.images[(width, height)]
+        shm = XShmSegmentInfo()
+        image = self.xext.XShmCreateImage(self.dpy, self.visual, self.depth, Z_PIXMAP, None, ctypes.byref(shm), width, height)
+        if not image: raise RuntimeError("XShmCreateImage failed")
+        self.images[(width, height)] = (image, shm, None)  # Registered now, so close() frees it if attaching fails
+        contents = image.contents
+        if contents.bits_per_pixel != 32: raise RuntimeError(f"Expected a 32 bpp visual, got {contents.bits_per_pixel} bpp")
+        size = contents.bytes_per_line * contents.height
+        shm.shmid = self.libc.shmget(IPC_PRIVATE, size, IPC_CREAT | 0o600)
+        if shm.shmid < 0: raise RuntimeError("shmget failed")
+        shm.shmaddr = contents.data = self.libc.shmat(shm.shmid, None, 0)
+        shm.readOnly = 0
+        if shm.shmaddr in (None, ctypes.c_void_p(-1).value):
+            shm.shmaddr = None
+            raise RuntimeError("shmat failed")
+        _x_errors.clear()
+        self.xext.XShmAttach(self.dpy, ctypes.byref(shm))
+        self.x11.XSync(self.dpy, 0)
+        # Marked for removal now, so the segment goes away with both attachments even if this process dies
+        self.libc.shmctl(shm.shmid, IPC_RMID, None)
+        if _x_errors: raise RuntimeError("XShmAttach failed (is the display remote?)")
+        buffer = (ctypes.c_uint8 * size).from_address(shm.shmaddr)
+        rows = np.frombuffer(buffer, dtype=np.uint8).reshape(contents.height, contents.bytes_per_line)
+        self.images[(width, height)] = (image, shm, rows[:, :width * 4].reshape(height, width, 4))
+        return self.images[(width, height)]
+
+    def _create_damage(self):
+        self.xdamage, self.xfixes = _load_xdamage()
+        event_base, error_base = ctypes.c_int(), ctypes.c_int()
+        if not self.xdamage.XDamageQueryExtension(self.dpy, ctypes.byref(event_base), ctypes.byref(error_base)):
+            raise RuntimeError("X server has no DAMAGE extension")
+        self.damage = self.xdamage.XDamageCreate(self.dpy, self.root, X_DAMAGE_REPORT_NON_EMPTY)
+        self.damage_parts = self.xfixes.XFixesCreateRegion(self.dpy, None, 0)
+
+    def _damaged(self, rects):
+        """Whether anything inside rects (the whole region for None) was drawn since the last call, which clears all damage."""
+        self.xdamage.XDamageSubtract(self.dpy, self.damage, 0, self.damage_parts)
+        n = ctypes.c_int()
+        parts = self.xfixes.XFixesFetchRegion(self.dpy, self.damage_parts, ctypes.byref(n))
+        targets = [(self.x + x, self.y + y, w, h) for x, y, w, h in (rects or [(0, 0, self.width, self.height)])]
+        damaged = any(_overlap_area((r.x, r.y, r.width, r.height), t) > 0 for r in (parts[k] for k in range(n.value)) for t in targets)
+        if parts: self.x11.XFree(parts)
+        while self.x11.XPending(self.dpy): self.x11.XNextEvent(self.dpy, self.event)  # Drop the damage notifications
+        return damaged
+
+    def _get_image(self, x, y, w, h):
+        image, _, view = self._shm_image(w, h)
+        _x_errors.clear()
+        if not self.xext.XShmGetImage(self.dpy, self.root, image, self.x + x, self.y + y, ALL_PLANES) or _x_errors:
+            raise RuntimeError("XShmGetImage failed (does the region lie inside the screen?)")
+        return view
+
+    def grab(self, after=None, rects=None):
+        t = time.perf_counter()
+        # Damage outside rects is cleared without being grabbed, so only a frame that covers rects can be reused
+        if self.damage is not None and self.latest is not None and self.latest.covers(rects) and not self._damaged(rects):
+            self.latest = Frame(self.latest.bgra, captured_at=t, changed=False, owner=self, rects=self.latest.rects)
+            self.latest.bytes_captured = 0
+            return self.latest
+        slot = self.ring[self.ring_idx]
+        self.ring_idx = (self.ring_idx + 1) % len(self.ring)
+        for x, y, w, h in rects or [(0, 0, self.width, self.height)]:
+            np.copyto(slot[y:y+h, x:x+w], self._get_image(x, y, w, h))
+        self.latest = Frame(slot, captured_at=t, owner=self, rects=rects)
+        return self.latest
+
+    def take_counts(self):
+        return {}
+
+    def close(self):
+        if self.dpy is None: return
+        if self.damage is not None: self.xdamage.XDamageDestroy(self.dpy, self.damage)
+        if self.damage_parts is not None: self.xfixes.XFixesDestroyRegion(self.dpy, self.damage_parts)
+        for image, shm, _ in self.images.values():
+            if shm.shmaddr:
+                self.xext.XShmDetach(self.dpy, ctypes.byref(shm))
+                self.x11.XSync(self.dpy, 0)
+                self.libc.shmdt(shm.shmaddr)
+            self.x11.XFree(image)  # Only the struct: its data was the segment
+        self.images = {}
+        self.x11.XCloseDisplay(self.dpy)
+        self.x11.XSetErrorHandler(ctypes.cast(self.previous_error_handler, X_ERROR_HANDLER))
+        self.dpy = None
+
+class ThreadedCapture:
+    """
+    Runs another capture on a background thread at rate_hz, into a double buffer, so a step never waits on the
+    X server. grab(after, rects) hands out the freshest frame captured at or after `after`, waiting up to timeout
+    for one (and counting a stale frame if it has to settle for an older one). The thread grabs the rects of the
+    latest grab() call, so a frame covering new rects takes one capture period to arrive. The buffer handed out
+    is not written again until the next grab(); the thread keeps capturing into the other one. `changed` is
+    False when no new pixels arrived since the previous grab().
+    """
+    def __init__(self, inner, rate_hz=CAPTURE_HZ, timeout=1.0):
+        self.inner = inner
+        self.period = 1.0 / rate_hz
+        self.timeout = timeout
+        self.buffers = None  # Allocated on the first capture, once the frame size is known
+        self.captured_at, self.buffer_rects = [None, None], [None, None]
+        self.rects = None  # What the thread grabs: the rects of the last grab() call
+        self.ready = self.writing = self.pinned = None  # Buffer indices: freshest complete, being written, handed out
+        self.changed = False
+        self.latest = self.error = None
+        self.counts = {"frames": 0, "stale_frames": 0, "wait_ms": 0.0}
+        self.cond = threading.Condition()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="capture", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        next_t = time.perf_counter()
+        while not self.stopping.is_set():
+            try:
+                frame = self.inner.grab(rects=self.rects)
+            except Exception as e:
+                with self.cond:
+                    self.error = e
+                    self.cond.notify_all()
+                return
+            with self.cond:
+                if self.buffers is None: self.buffers = np.empty((2,) + frame.bgra.shape, dtype=np.uint8)
+                target = None
+                if frame.changed or self.ready is None:
+                    # Never the buffer handed out; the freshest one only while the other is handed out
+                    target = self.writing = 1 - self.pinned if self.pinned is not None else (1 - self.ready if self.ready is not None else 0)
+            if target is not None:
+                for x, y, w, h in frame.rects or [(0, 0, frame.bgra.shape[1], frame.bgra.shape[0])]:
+                    np.copyto(self.buffers[target][y:y+h, x:x+w], frame.bgra[y:y+h, x:x+w])
+            with self.cond:
+                if target is not None:
+                    self.ready, self.writing, self.changed = target, None, True
+                    self.buffer_rects[target] = frame.rects
+                self.captured_at[self.ready] = frame.captured_at
+                self.counts["frames"] += 1
+                self.cond.notify_all()
+            next_t += self.period
+            delay = next_t - time.perf_counter()
+            if delay > 0: self.stopping.wait(delay)
+            else: next_t = time.perf_counter()  # Fell behind; don't try to catch up with a burst
+
+    def grab(self, after=None, rects=None):
+        t0 = time.perf_counter()
+        with self.cond:
+            self.pinned = None
+            self.rects = rects
+            covered = lambda: self.buffer_rects[self.ready] is None or self.buffer_rects[self.ready] == rects
+            usable = lambda: self.error is not None or (self.ready is not None and self.writing != self.ready)
+            fresh = lambda: usable() and (self.error is not None or ((after is None or self.captured_at[self.ready] >= after) and covered()))
+            if not self.cond.wait_for(fresh, self.timeout):
+                self.counts["stale_frames"] += 1
+                self.cond.wait_for(usable)
+            if self.error is not None: raise RuntimeError(f"Capture thread failed: {self.error}") from self.error
+            self.pinned = self.ready
+            self.latest = Frame(self.buffers[self.pinned], captured_at=self.captured_at[self.pinned], changed=self.changed, owner=self,
+                                rects=self.buffer_rects[self.pinned])
+            self.changed = False
+            self.counts["wait_ms"] += (time.perf_counter() - t0) * 1000.0
+        return self.latest
+
+    def take_counts(self):
+        """Frames captured, stale frames handed out and time spent waiting in grab() since the last call."""
+        with self.cond:
+            counts = dict(self.counts)
+            self.counts = {"frames": 0, "stale_frames": 0, "wait_ms": 0.0}
+        return counts
+
+    def close(self):
+        self.stopping.set()
+        self.thread.join(timeout=1.0)
+        self.inner.close()
+
+CAPTURE_BACKENDS = {
+    "mss": lambda region, sct: MssCapture(region, sct),
+    "xshm": lambda region, sct: XShmCapture(region),
+}
+
+def make_capture(region, name=None, sct=None, rate_hz=None):
+    """
+    Capture backend from CAPTURE_BACKENDS (default: FITCATS_CAPTURE or "mss"), on a background thread when
+    rate_hz (default FITCATS_CAPTURE_HZ) is above 0. sct is an mss instance to reuse on the calling thread.
+    If the xshm backend cannot start (no MIT-SHM, remote display), this falls back to mss with a warning.
+    """
+    name = name or CAPTURE_BACKEND
+    rate_hz = CAPTURE_HZ if rate_hz is None else rate_hz
+    if rate_hz > 0: sct = None  # mss instances must not be shared across threads
+    try:
+        capture = CAPTURE_BACKENDS[name](region, sct)
+    except (OSError, RuntimeError) as e:
+        if name == "mss": raise
+        print(f"Warning: {name} capture unavailable ({e}); falling back to mss.")
+        capture = MssCapture(region, sct)
+    return ThreadedCapture(capture, rate_hz) if rate_hz > 0 else capture
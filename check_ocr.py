@@ -0,0 +1,91 @@
+import cv2
+import numpy as np
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+from fit_cats_env import (get_digit_templates, recognize_score_with_templates,
+                          recognize_score_matrix, compile_digit_exemplars)
+
+# Regression check for the score OCR engines, headless, on labelled captures: score_<n>_*.png files that are
+# crops of score_roi or full game frames (cropped with calibration_data.json). Crops of the readings logged as
+# failures in "Fit Cats notes.txt" go in ocr_cases/; game-over screenshots under highscores/ are read as well.
+# The run fails if no capture of a logged case is found, or if the matrix engine misreads any that is.
+
+# Scores the notes record as misread by an earlier OCR method, with what was seen
+NOTES_CASES = {
+    20: "read as 40", 34: "read as 3 / 314", 142: "read as 2", 22: "read as 2", 32: "read as 3",
+    72: "read as blank", 440: "read as 40", 30: "read as 3", 38: "read as 3", 48: "read as 8 / 148",
+    84: "read as 8", 120: "read as 2", 130: "read as 13", 154: "read as 5", 164: "read as 6",
+    178: "read as 78", 230: "read as 43", 26: "read as 36", 70: "read as 10", 126: "read as 136",
+    170: "read as 110", 208: "read as 08", 216: "read as 416", 256: "read as 356",
+}
+
+# --- Labelled Captures ---
+def load_labelled(capture_dir):
+    """Returns [(score, score_img)] for every score_<n>_*.png under capture_dir."""
+    roi = None
+    if os.path.exists("calibration_data.json"):
+        with open("calibration_data.json", "r") as f: roi = json.load(f).get("score_roi")
+    samples = []
+    for root, _, files in os.walk(capture_dir):
+        for name in sorted(files):
+            m = re.match(r'score_(\d+)_.*\.png$', name)
+            if not m: continue
+            img = cv2.imread(os.path.join(root, name))
+            if img is None: continue
+            # Full frames are cropped to the score; anything no larger than the ROI is taken as a crop already
+            if roi is not None and (img.shape[0] > roi['h'] or img.shape[1] > roi['w']):
+                img = img[roi['y']:roi['y']+roi['h'], roi['x']:roi['x']+roi['w']]
+            samples.append((int(m.group(1)), img))
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the score OCR engines against labelled scores.")
+    parser.add_argument("--captures", type=str, nargs="+", default=["ocr_cases", "highscores"], help="Directories of score_<n>_*.png captures")
+    parser.add_argument("--templates", type=str, default="digit_templates", help="Digit template directory")
+    args = parser.parse_args()
+
+    samples = [sample for d in args.captures if os.path.exists(d) for sample in load_labelled(d)]
+    digit_templates = get_digit_templates(args.templates)
+    if not digit_templates:
+        print(f"FAIL: no digit templates in {args.templates}")
+        sys.exit(1)
+    cases = sorted({score for score, _ in samples if score in NOTES_CASES})
+    missing = sorted(set(NOTES_CASES) - set(cases))
+    print(f"{len(samples)} labelled captures from {', '.join(args.captures)}, templates from {args.templates}")
+    print(f"logged cases captured: {len(cases)} / {len(NOTES_CASES)}" + (f" | missing {missing}" if missing else ""))
+    if not cases:
+        print("FAIL: no capture of any logged misread; save score crops as ocr_cases/score_<n>_*.png")
+        sys.exit(1)
+    ocr_index = compile_digit_exemplars(digit_templates)
+
+    engines = {
+        "templates": lambda img: recognize_score_with_templates(img, digit_templates),
+        "matrix": lambda img: recognize_score_matrix(img, ocr_index)[0],
+    }
+    notes_failures = []
+    for name, read in engines.items():
+        times, wrong = [], []
+        for score, img in samples:
+            t0 = time.perf_counter()
+            text = read(img)
+            times.append(time.perf_counter() - t0)
+            if text != str(score): wrong.append((score, text))
+        times = np.array(times) * 1000.0
+        print(f"{name:<9} | {1 - len(wrong) / len(samples):6.1%} correct | mean {times.mean():6.3f} ms | p95 {np.percentile(times, 95):6.3f} ms")
+        for score, text in wrong:
+            note = f" (notes: {NOTES_CASES[score]})" if score in NOTES_CASES else ""
+            print(f"    {score} -> '{text}'{note}")
+        if name == "matrix": notes_failures = [s for s, _ in wrong if s in NOTES_CASES]
+
+    if notes_failures:
+        print(f"FAIL: matrix engine misreads logged cases {notes_failures}")
+        sys.exit(1)
+    print(f"OK: matrix engine reads every captured logged case ({len(cases)}).")
+
+if __name__ == "__main__":
+    main()
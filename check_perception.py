@@ -0,0 +1,186 @@
+import cv2
+import numpy as np
+import os
+import re
+import sys
+import json
+import time
+import argparse
+
+from fit_cats_env import (get_board_census, get_next_cat_type, recognize_score_with_templates, recognize_score_matrix,
+                          load_template_index, make_cat_mask, find_template, RestartDetector, MAX_CAT_TYPES, GAME_OVER_THRESHOLD)
+
+# Golden-frame perception regression suite. Runs headless (no X server) over a labelled corpus of saved
+# full-game frames, such as the PNGs written under highscores/, and reports per-stage latency percentiles
+# and accuracy. With a stored baseline it exits nonzero when any stage gets slower or less accurate than
+# the baseline allows.
+#
+# Labels live in a JSON file keyed by frame path relative to --frames; every field is optional:
+#   {"global/score_120_2025-01-01_12-00-00.png": {"census": {"0": 3, "4": 1}, "next_cat": 2, "score": 120, "game_over": false}}
+# A frame named score_<n>_*.png is labelled with score n unless the file says otherwise.
+# Use --init-labels to write the current pipeline's output as a starting point for hand-checking.
+
+STAGES = ["census", "next_cat", "score_templates", "score_matrix", "restart", "restart_detector"]
+STATEFUL_STAGES = {"restart_detector"}  # Run once per frame, in corpus order, as the env would
+
+def load_corpus(frame_dir, labels):
+    """Returns [(rel_path, frame, label)] for every PNG under frame_dir."""
+    corpus = []
+    for root, _, files in os.walk(frame_dir):
+        for name in sorted(files):
+            if not name.endswith(".png"): continue
+            path = os.path.join(root, name)
+            img = cv2.imread(path)
+            if img is None: continue
+            rel_path = os.path.relpath(path, frame_dir)
+            label = dict(labels.get(rel_path, {}))
+            m = re.match(r'score_(\d+)_', name)
+            if m and "score" not in label: label["score"] = int(m.group(1))
+            corpus.append((rel_path, img, label))
+    return corpus
+
+def crop(img, roi):
+    return img[roi['y']:roi['y']+roi['h'], roi['x']:roi['x']+roi['w']]
+
+def census_vector(census_label):
+    census = np.zeros(MAX_CAT_TYPES, dtype=np.float32)
+    for cat_id, count in census_label.items(): census[int(cat_id)] = count
+    return census
+
+def run_suite(corpus, calib, template_index, digit_templates, ocr_index, template_restart, repeats):
+    """
+    Runs every stage on every frame. "restart" is a full-frame find_template; "restart_detector" is the env's
+    RestartDetector fed the corpus as one stream. Returns ({stage: [seconds]}, {stage: [correct]},
+    {rel_path: predictions}, restart detector counts).
+    """
+    mask = make_cat_mask(calib)
+    restart_detector = RestartDetector(template_restart)
+    stages = {
+        "census": lambda img: get_board_census(crop(img, calib["agent_view_roi"]), mask, template_index),
+        "next_cat": lambda img: get_next_cat_type(crop(img, calib["next_cat_roi"]), template_index),
+        "score_templates": lambda img: recognize_score_with_templates(crop(img, calib["score_roi"]), digit_templates),
+        "score_matrix": lambda img: recognize_score_matrix(crop(img, calib["score_roi"]), ocr_index)[0],
+        "restart": lambda img: find_template(img, template_restart)[0],
+        "restart_detector": lambda img: restart_detector(img)[0],
+    }
+    times = {stage: [] for stage in stages}
+    correct = {stage: [] for stage in stages}
+    predictions = {}
+    for rel_path, img, label in corpus:
+        out = {}
+        for stage, run in stages.items():
+            for _ in range(1 if stage in STATEFUL_STAGES else repeats):
+                t0 = time.perf_counter()
+                out[stage] = run(img)
+                times[stage].append(time.perf_counter() - t0)
+
+        census, _ = out["census"]
+        if "census" in label: correct["census"].append(bool(np.array_equal(census, census_vector(label["census"]))))
+        if "next_cat" in label: correct["next_cat"].append(out["next_cat"] == label["next_cat"])
+        for stage in ("score_templates", "score_matrix"):
+            if "score" in label: correct[stage].append(out[stage] == str(label["score"]))
+        if "game_over" in label:
+            for stage in ("restart", "restart_detector"):
+                correct[stage].append((out[stage] > GAME_OVER_THRESHOLD) == label["game_over"])
+
+        predictions[rel_path] = {
+            "census": {str(i): int(c) for i, c in enumerate(census) if c > 0},
+            "next_cat": int(out["next_cat"]),
+            "score": int(out["score_templates"]) if out["score_templates"].isdigit() else -1,
+            "game_over": bool(out["restart"] > GAME_OVER_THRESHOLD),
+        }
+    return times, correct, predictions, restart_detector.take_counts()
+
+def summarize(times, correct):
+    report = {}
+    for stage in STAGES:
+        samples = np.asarray(times[stage]) * 1000.0
+        report[stage] = {
+            "p50_ms": float(np.percentile(samples, 50)) if len(samples) else None,
+            "p95_ms": float(np.percentile(samples, 95)) if len(samples) else None,
+            "accuracy": float(np.mean(correct[stage])) if correct[stage] else None,
+            "labelled": len(correct[stage]),
+        }
+    return report
+
+def check_regressions(report, baseline, latency_tolerance, latency_slack_ms, accuracy_tolerance):
+    """Returns a list of human-readable regressions against the baseline report."""
+    regressions = []
+    for stage, base in baseline.items():
+        current = report.get(stage)
+        if current is None: continue
+        if base.get("p95_ms") is not None and current["p95_ms"] is not None:
+            limit = base["p95_ms"] * (1 + latency_tolerance) + latency_slack_ms
+            if current["p95_ms"] > limit:
+                regressions.append(f"{stage}: p95 {current['p95_ms']:.2f} ms > {limit:.2f} ms (baseline {base['p95_ms']:.2f} ms)")
+        if base.get("accuracy") is not None and current["accuracy"] is not None:
+            if current["accuracy"] < base["accuracy"] - accuracy_tolerance:
+                regressions.append(f"{stage}: accuracy {current['accuracy']:.1%} < baseline {base['accuracy']:.1%}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Golden-frame perception benchmark and accuracy regression suite.")
+    parser.add_argument("--frames", type=str, default="highscores", help="Directory of saved full-game frames")
+    parser.add_argument("--labels", type=str, default=None, help="Labels JSON (default: <frames>/labels.json)")
+    parser.add_argument("--baseline", type=str, default="perception_baseline.json", help="Baseline report JSON")
+    parser.add_argument("--calibration", type=str, default="calibration_data.json")
+    parser.add_argument("--templates", type=str, default="./cat_templates")
+    parser.add_argument("--digits", type=str, default="digit_templates")
+    parser.add_argument("--restart-template", type=str, default="template_restart.png")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs of every stage per frame")
+    parser.add_argument("--latency-tolerance", type=float, default=0.25, help="Allowed relative p95 slowdown")
+    parser.add_argument("--latency-slack-ms", type=float, default=1.0, help="Allowed absolute p95 slowdown on top")
+    parser.add_argument("--accuracy-tolerance", type=float, default=0.0, help="Allowed drop in accuracy")
+    parser.add_argument("--update-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--init-labels", action="store_true", help="Write predictions for unlabelled frames into the labels file")
+    args = parser.parse_args()
+    labels_path = args.labels or os.path.join(args.frames, "labels.json")
+
+    if not os.path.exists(args.calibration):
+        print(f"Error: {args.calibration} not found. Run setup_agent.py first.")
+        sys.exit(2)
+    with open(args.calibration, "r") as f: calib = json.load(f)
+    labels = {}
+    if os.path.exists(labels_path):
+        with open(labels_path, "r") as f: labels = json.load(f)
+
+    corpus = load_corpus(args.frames, labels) if os.path.exists(args.frames) else []
+    if not corpus:
+        print(f"Error: no frames found under {args.frames}.")
+        sys.exit(2)
+    template_index, digit_templates, ocr_index = load_template_index(args.templates, args.digits)
+    template_restart = cv2.imread(args.restart_template, cv2.IMREAD_COLOR)
+
+    times, correct, predictions, restart_counts = run_suite(corpus, calib, template_index, digit_templates, ocr_index, template_restart, args.repeats)
+    report = summarize(times, correct)
+
+    print(f"--- {len(corpus)} frames, {sum(1 for _, _, l in corpus if l)} with labels ---")
+    for stage, r in report.items():
+        accuracy = f"{r['accuracy']:6.1%} of {r['labelled']}" if r["accuracy"] is not None else "unlabelled"
+        print(f"{stage:<16} | p50 {r['p50_ms']:8.3f} ms | p95 {r['p95_ms']:8.3f} ms | accuracy {accuracy}")
+    print("restart_detector | " + ", ".join(f"{k} {v}" for k, v in restart_counts.items()))
+
+    if args.init_labels:
+        added = {path: pred for path, pred in predictions.items() if path not in labels}
+        labels.update(added)
+        with open(labels_path, "w") as f: json.dump(labels, f, indent=2, sort_keys=True)
+        print(f"Wrote predictions for {len(added)} unlabelled frames to {labels_path}; check them by hand before relying on them.")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f: json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}.")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+        return
+
+    with open(args.baseline, "r") as f: baseline = json.load(f)
+    regressions = check_regressions(report, baseline, args.latency_tolerance, args.latency_slack_ms, args.accuracy_tolerance)
+    if regressions:
+        print("FAIL: regressions against baseline:")
+        for r in regressions: print(f"    {r}")
+        sys.exit(1)
+    print("OK: no regressions against baseline.")
+
+if __name__ == "__main__":
+    main()
@@ -7,15 +7,29 @@ import time
 import os
 import json
 import re
-from collections import deque
+import hashlib
+import shutil
+import zlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque, OrderedDict
 import datetime
 from utils import start_game
+from tracing import span
+from capture import make_capture, merge_rects, roi_rect, CAPTURE_ROIS
+from input_backend import make_input
 
 # --- Constants ---
 MAX_CAT_TYPES = 15
 COLOR_DIST_THRESHOLD = 100
 IMG_SIZE = 160 
 CLICK_COOLDOWN_SECONDS = 0.6
+PERCEPTION_THREADS = int(os.environ.get("FITCATS_PERCEPTION_THREADS", "0"))  # 0 runs perception stages one after another
+PERCEPTION_SCALE = float(os.environ.get("FITCATS_PERCEPTION_SCALE", "1.0"))  # Board census runs on the board resized by this
+CONTROL_HZ = float(os.environ.get("FITCATS_CONTROL_HZ", "0"))  # > 0 paces steps on a fixed-rate deadline schedule instead of fixed sleeps
+MACRO_POLL_SECONDS = 0.05  # Macro actions: observation interval while the board settles (without FITCATS_CONTROL_HZ)
+MACRO_SETTLE_FRAMES = 3    # Consecutive still observations that count as settled
+MACRO_MAX_SECONDS = 4.0    # Longest a drop waits for the board to settle
 
 # --- Custom Template-Based OCR Functions ---
 def get_digit_templates(template_dir="digit_templates"):
@@ -60,18 +74,110 @@ def recognize_score_with_templates(score_img, digit_templates):
         if best_overall_digit: recognized_score += best_overall_digit
     return recognized_score
 
+# Matrix OCR: every digit box is normalized to OCR_SIZE and correlated against all exemplars in one product.
+OCR_SIZE = (16, 24)  # (w, h); boxes are padded to this aspect ratio first so a "1" stays narrow
+OCR_MIN_CONFIDENCE = 0.5
+OCR_ENGINE = os.environ.get("FITCATS_OCR", "templates")  # "templates" (cv2.matchTemplate) or "matrix"
+
+def normalize_digit(digit_img):
+    """Zero-mean, unit-norm OCR_SIZE vector of a binary digit crop, or None if the crop is empty."""
+    h, w = digit_img.shape
+    if h == 0 or w == 0: return None
+    target_h = max(h, int(np.ceil(w * OCR_SIZE[1] / OCR_SIZE[0])))
+    target_w = max(w, int(np.ceil(h * OCR_SIZE[0] / OCR_SIZE[1])))
+    canvas = np.zeros((target_h, target_w), dtype=np.uint8)
+    y0, x0 = (target_h - h) // 2, (target_w - w) // 2
+    canvas[y0:y0+h, x0:x0+w] = digit_img
+    v = cv2.resize(canvas, OCR_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32).ravel()
+    v -= v.mean()
+    norm = np.linalg.norm(v)
+    return v / norm if norm > 0 else None
+
+def crop_exemplar(template_img):
+    """Crops a padded exemplar from digit_templates/ to the box find_contours() would give its digit."""
+    eroded = cv2.erode(template_img, np.ones((2, 2), np.uint8), iterations=1)
+    contours, _ = cv2.findContours(eroded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours: return template_img
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    return template_img[y:y+h, x:x+w]
+
+def compile_digit_exemplars(digit_templates):
+    """Stacks every exemplar into an (n, OCR_SIZE area) matrix. Returns {"matrix", "labels"}."""
+    rows, labels = [], []
+    for digit_str, templates in sorted(digit_templates.items()):
+        for template_img in templates:
+            v = normalize_digit(crop_exemplar(template_img))
+            if v is not None:
+                rows.append(v)
+                labels.append(int(digit_str))
+    return {"matrix": np.array(rows, dtype=np.float32).reshape(-1, OCR_SIZE[0] * OCR_SIZE[1]),
+            "labels": np.array(labels, dtype=np.int32)}
+
+def recognize_score_matrix(score_img, ocr_index, min_confidence=OCR_MIN_CONFIDENCE):
+    """
+    Same contour boxes as recognize_score_with_templates(), classified with one matrix product.
+    Returns (text, confidences); a box no digit correlates with above min_confidence is skipped, like the template matcher.
+    """
+    sorted_boxes, thresh = find_contours(score_img)
+    if not sorted_boxes or len(ocr_index["labels"]) == 0: return "", []
+    queries = [normalize_digit(thresh[y:y+h, x:x+w]) for (x, y, w, h) in sorted_boxes]
+    queries = np.array([q if q is not None else np.zeros(OCR_SIZE[0] * OCR_SIZE[1], np.float32) for q in queries])
+
+    scores = queries @ ocr_index["matrix"].T  # (boxes, exemplars) correlation coefficients
+    per_digit = np.full((len(queries), 10), -1.0, dtype=np.float32)
+    for d in range(10):
+        of_digit = ocr_index["labels"] == d
+        if of_digit.any(): per_digit[:, d] = scores[:, of_digit].max(axis=1)
+
+    digits, confidences = per_digit.argmax(axis=1), per_digit.max(axis=1)
+    accepted = confidences > min_confidence
+    return "".join(str(d) for d in digits[accepted]), [float(c) for c in confidences[accepted]]
+
 # --- Cat Detection & Classification Functions (Ported from debug_cat_count.py) ---
 
-def get_dominant_color(img, k=3):
-    if img is None or img.shape[0] < 5 or img.shape[1] < 5:
-        return None
-    pixels = np.float32(img.reshape(-1, 3))
+def _dominant_color_kmeans(pixels, k):
     criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 200, .1)
-    _, labels, centers = cv2.kmeans(pixels, k, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
+    _, labels, centers = cv2.kmeans(np.float32(pixels), k, None, criteria, 10, cv2.KMEANS_RANDOM_CENTERS)
     _, counts = np.unique(labels, return_counts=True)
     sorted_centers = centers[np.argsort(-counts)]
     return np.uint8(sorted_centers[0])
 
+def _dominant_color_kmeans_fast(pixels, k):
+    # One attempt, seeded deterministically by splitting the pixels into brightness quantiles
+    pixels = np.float32(pixels)
+    brightness = pixels.sum(axis=1)
+    labels = np.empty((len(pixels), 1), dtype=np.int32)
+    labels[np.argsort(brightness, kind='stable'), 0] = np.arange(len(pixels)) * k // len(pixels)
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 1.0)
+    _, labels, centers = cv2.kmeans(pixels, k, labels, criteria, 1, cv2.KMEANS_USE_INITIAL_LABELS)
+    counts = np.bincount(labels.ravel(), minlength=k)
+    return np.uint8(centers[np.argmax(counts)])
+
+def _dominant_color_histogram(pixels, k, bits=4):
+    # Most populated cell of a reduced-bit BGR histogram, refined to the mean of its pixels
+    q = (pixels >> (8 - bits)).astype(np.int32)
+    codes = (q[:, 0] << (2 * bits)) | (q[:, 1] << bits) | q[:, 2]
+    mode = np.argmax(np.bincount(codes, minlength=1 << (3 * bits)))
+    return np.uint8(pixels[codes == mode].mean(axis=0))
+
+DOMINANT_COLOR_METHODS = {
+    "kmeans": _dominant_color_kmeans,
+    "kmeans_fast": _dominant_color_kmeans_fast,
+    "histogram": _dominant_color_histogram,
+}
+DOMINANT_COLOR_METHOD = os.environ.get("FITCATS_DOMINANT_COLOR", "kmeans")
+
+def get_dominant_color(img, k=3, method=None):
+    """
+    Returns the dominant BGR color of a patch, or None if the patch is too small.
+    method selects a backend from DOMINANT_COLOR_METHODS (default: FITCATS_DOMINANT_COLOR or "kmeans").
+    """
+    if img is None or img.shape[0] < 5 or img.shape[1] < 5:
+        return None
+    pixels = img.reshape(-1, 3)
+    with span("dominant_color", method=method or DOMINANT_COLOR_METHOD):
+        return DOMINANT_COLOR_METHODS[method or DOMINANT_COLOR_METHOD](pixels, k)
+
 def circle_intersection_area(c1, c2):
     x1, y1, r1 = float(c1[0]), float(c1[1]), float(c1[2])
     x2, y2, r2 = float(c2[0]), float(c2[1]), float(c2[2])
@@ -83,54 +189,197 @@ def circle_intersection_area(c1, c2):
     beta = np.arccos((r2_sq + d**2 - r1_sq) / (2 * r2 * d))
     return r1_sq * alpha + r2_sq * beta - 0.5 * np.sqrt((-d + r1 + r2) * (d + r1 - r2) * (d - r1 + r2) * (d + r1 + r2))
 
-def find_candidate_circles(img, mask=None):
+# Hough radius bands: (minDist, param2, minRadius, maxRadius), in full-resolution pixels.
+HOUGH_BANDS = [
+    (15, 40, 15, 50),    # Pass 1: Standard (15-50)
+    (10, 30, 15, 20),    # Pass 2: Small (8-20)
+    (30, 45, 50, 140),   # Pass 3: Large (50-140)
+    (50, 30, 140, 180),  # Pass 4: Gigantic (140-180)
+]
+BAND_VOTE_DECAY = 0.67  # param2 factor per halving of resolution below full resolution
+
+def scale_hough_bands(bands, scale):
+    """Bands for a board resized by `scale`: distances and radii shrink, and a downscaled board needs fewer edge votes."""
+    if scale == 1.0: return bands
+    decay = BAND_VOTE_DECAY ** max(0.0, -np.log2(scale))
+    return [(min_dist * scale, float(param2 * decay), max(1, int(round(min_radius * scale))), int(np.ceil(max_radius * scale)))
+            for min_dist, param2, min_radius, max_radius in bands]
+
+def _hough_band(blurred, band, region=None):
+    min_dist, param2, min_radius, max_radius = band
+    img, ox, oy = blurred, 0, 0
+    if region is not None:
+        # A circle centered in the region lies within max_radius of it
+        pad = max_radius + 4
+        ox, oy = max(0, region[0] - pad), max(0, region[1] - pad)
+        img = img[oy:region[3] + pad + 1, ox:region[2] + pad + 1]
+    circles = cv2.HoughCircles(img, cv2.HOUGH_GRADIENT, dp=1, minDist=min_dist,
+                               param1=50, param2=param2, minRadius=min_radius, maxRadius=max_radius)
+    if circles is None: return np.zeros((0, 3), dtype=np.float32)
+    circles = circles[0, :]
+    circles[:, 0] += ox
+    circles[:, 1] += oy
+    if region is not None:
+        inside = (circles[:, 0] >= region[0]) & (circles[:, 0] < region[2]) & (circles[:, 1] >= region[1]) & (circles[:, 1] < region[3])
+        circles = circles[inside]
+    return circles
+
+def _hough_bands(blurred, bands, region=None, executor=None):
+    """
+    Runs every band on `blurred`, keeping only centers inside region (x0, y0, x1, y1) if given.
+    With an executor the bands run concurrently (HoughCircles releases the GIL); results keep band order either way.
+    """
+    if executor is not None: results = list(executor.map(lambda band: _hough_band(blurred, band, region), bands))
+    else: results = [_hough_band(blurred, band, region) for band in bands]
+    all_circles = []
+    for circles in results: all_circles.extend(circles)
+    return all_circles
+
+def _blur_for_hough(img, mask):
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     if mask is not None:
         masked_gray = cv2.bitwise_and(gray, mask)
-        blurred = cv2.GaussianBlur(masked_gray, (5, 5), 1.5)
+        return cv2.GaussianBlur(masked_gray, (5, 5), 1.5)
+    return cv2.GaussianBlur(gray, (5, 5), 1.5)
+
+def find_candidate_circles(img, mask=None, bands=None, regions=None, executor=None):
+    """
+    Hough candidates (x, y, r) as uint16 rows for every band in `bands` (default HOUGH_BANDS).
+    The blur is built once per frame and shared by all bands.
+    With `regions` (a list of (x0, y0, x1, y1) rects), only circles centered inside them are searched for,
+    and each band only looks at the rect grown by its own maximum radius.
+    An executor (e.g. a ThreadPoolExecutor) runs the bands concurrently.
+    """
+    with span("hough", regions=len(regions) if regions is not None else 0):
+        return _find_candidate_circles(img, mask, bands or HOUGH_BANDS, regions, executor)
+
+def _find_candidate_circles(img, mask, bands, regions, executor):
+    if regions is None:
+        all_circles = _hough_bands(_blur_for_hough(img, mask), bands, executor=executor)
     else:
-        blurred = cv2.GaussianBlur(gray, (5, 5), 1.5)
-    
-    # Pass 1: Standard (15-50)
-    circles_mid = cv2.HoughCircles(blurred, cv2.HOUGH_GRADIENT, dp=1, minDist=15,
-                               param1=50, param2=40, minRadius=15, maxRadius=50)
-    
-    # Pass 2: Small (8-20)
-    circles_small = cv2.HoughCircles(blurred, cv2.HOUGH_GRADIENT, dp=1, minDist=10,
-                               param1=50, param2=30, minRadius=15, maxRadius=20)
-
-    # Pass 3: Large (50-140)
-    circles_large = cv2.HoughCircles(blurred, cv2.HOUGH_GRADIENT, dp=1, minDist=30,
-                               param1=50, param2=45, minRadius=50, maxRadius=140)
-                               
-    # Pass 4: Gigantic (140-180)
-    circles_giant = cv2.HoughCircles(blurred, cv2.HOUGH_GRADIENT, dp=1, minDist=50,
-                               param1=50, param2=30, minRadius=140, maxRadius=180)
-    
-    all_circles = []
-    if circles_mid is not None: all_circles.extend(circles_mid[0, :])
-    if circles_small is not None: all_circles.extend(circles_small[0, :])
-    if circles_large is not None: all_circles.extend(circles_large[0, :])
-    if circles_giant is not None: all_circles.extend(circles_giant[0, :])
+        all_circles = []
+        pad = max(band[3] for band in bands) + 8
+        for (x0, y0, x1, y1) in regions:
+            # Crop once per region, with room for the largest band
+            cx0, cy0 = max(0, x0 - pad), max(0, y0 - pad)
+            cx1, cy1 = min(img.shape[1], x1 + pad), min(img.shape[0], y1 + pad)
+            crop_mask = mask[cy0:cy1, cx0:cx1] if mask is not None else None
+            blurred = _blur_for_hough(img[cy0:cy1, cx0:cx1], crop_mask)
+            for c in _hough_bands(blurred, bands, (x0 - cx0, y0 - cy0, x1 - cx0, y1 - cy0), executor):
+                all_circles.append((c[0] + cx0, c[1] + cy0, c[2]))
 
     if not all_circles: return []
     circles = np.uint16(np.around(all_circles))
     return circles
 
+# --- Detectors ---
+# A detector maps (board_img, mask, regions=None) to candidate (x, y, r) uint16 rows, like find_candidate_circles.
+BG_DIFF_THRESHOLD = 30  # Per-channel difference from the empty board that marks a pixel as foreground
+BG_MIN_RADIUS = 15      # Candidates below this are dropped before classification anyway
+
+class BackgroundDetector:
+    """
+    Finds cats as the difference from a capture of the empty board. Foreground pixels inside the mask are
+    split into connected components, and each local maximum of their distance transform that is at least
+    BG_MIN_RADIUS deep is a circle center, with its depth as the radius.
+    """
+    def __init__(self, background, diff_threshold=BG_DIFF_THRESHOLD, min_radius=BG_MIN_RADIUS):
+        if background is None: raise ValueError("BackgroundDetector needs a capture of the empty board.")
+        self.background = background
+        self.diff_threshold = diff_threshold
+        self.min_radius = min_radius
+        # Square, since OpenCV dilates with rectangles separably; the greedy pass below settles anything the corners add
+        self.peak_kernel = np.ones((2 * min_radius + 1, 2 * min_radius + 1), np.uint8)
+
+    def __call__(self, img, mask=None, regions=None):
+        with span("background_detect"):
+            return self._detect(img, mask, regions)
+
+    def _detect(self, img, mask, regions):
+        if self.background.shape != img.shape:
+            self.background = cv2.resize(self.background, (img.shape[1], img.shape[0]), interpolation=cv2.INTER_AREA)
+        b, g, r = cv2.split(cv2.absdiff(img, self.background))
+        foreground = np.uint8(cv2.max(cv2.max(b, g), r) > self.diff_threshold) * 255
+        if mask is not None: foreground = cv2.bitwise_and(foreground, mask)
+        # Close small holes where a cat's color is near the background, then drop speckle
+        foreground = cv2.morphologyEx(foreground, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+        foreground = cv2.morphologyEx(foreground, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+
+        _, labels = cv2.connectedComponents(foreground, connectivity=8)
+        dist = cv2.distanceTransform(foreground, cv2.DIST_L2, 5)
+        ys, xs = np.nonzero((dist >= self.min_radius) & (dist >= cv2.dilate(dist, self.peak_kernel)))
+        order = np.argsort(-dist[ys, xs], kind='stable')
+        ys, xs = ys[order], xs[order]
+        radii, components = dist[ys, xs], labels[ys, xs]
+
+        # Deepest peaks first; a peak inside an accepted circle of its own component is part of that cat
+        accepted = []
+        for i in range(len(xs)):
+            if accepted:
+                a = np.array(accepted)
+                inside = (components[a] == components[i]) & \
+                         ((xs[a] - xs[i]) ** 2 + (ys[a] - ys[i]) ** 2 < np.maximum(radii[a], radii[i]) ** 2)
+                if inside.any(): continue
+            accepted.append(i)
+
+        circles = np.column_stack([xs[accepted], ys[accepted], radii[accepted]]).reshape(-1, 3)
+        if regions is not None: circles = circles[circles_in_regions(circles, regions)]
+        if len(circles) == 0: return []
+        return np.uint16(np.around(circles))
+
+DETECTORS = {
+    "hough": lambda background, executor, scale: functools.partial(find_candidate_circles, bands=scale_hough_bands(HOUGH_BANDS, scale), executor=executor),
+    "background": lambda background, executor, scale: BackgroundDetector(background, min_radius=max(1, int(round(BG_MIN_RADIUS * scale)))),
+}
+DETECTOR = os.environ.get("FITCATS_DETECTOR", "hough")
+
+def make_detector(name=None, background=None, executor=None, scale=1.0):
+    """
+    Board detector from DETECTORS (default: FITCATS_DETECTOR or "hough"). background is the empty-board capture;
+    executor lets backends that can split their work run it concurrently; scale is the board's perception scale.
+    """
+    return DETECTORS[name or DETECTOR](background, executor, scale)
+
+def nested_circle_keep_mask(circles, max_overlap=0.8):
+    """
+    True for every circle that filter_nested_circles keeps. The pairwise intersection-ratio matrix
+    is computed in one shot; only the order-dependent discard bookkeeping walks the rows that overlap.
+    """
+    circles = np.asarray(circles, dtype=np.float64).reshape(-1, 3)
+    keep = np.ones(len(circles), dtype=bool)
+    if len(circles) < 2: return keep
+
+    x, y, r = circles[:, 0], circles[:, 1], circles[:, 2]
+    dx, dy = x[:, None] - x[None, :], y[:, None] - y[None, :]
+    d = np.sqrt(dx * dx + dy * dy)
+    r1, r2 = np.minimum(r[:, None], r[None, :]), np.maximum(r[:, None], r[None, :])
+    r1_sq, r2_sq = r1 ** 2, r2 ** 2
+    area_smaller = np.pi * r1_sq
+
+    # Same cases as circle_intersection_area(smaller, larger)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        alpha = np.arccos((r1_sq + d ** 2 - r2_sq) / (2 * r1 * d))
+        beta = np.arccos((r2_sq + d ** 2 - r1_sq) / (2 * r2 * d))
+        lens = r1_sq * alpha + r2_sq * beta - 0.5 * np.sqrt((-d + r1 + r2) * (d + r1 - r2) * (d - r1 + r2) * (d + r1 + r2))
+        intersection = np.where(d >= r1 + r2, 0.0, np.where(d <= np.abs(r1 - r2), area_smaller, lens))
+        nested = (area_smaller > 0) & (intersection / area_smaller > max_overlap)
+    np.fill_diagonal(nested, False)
+
+    # Walk the nested pairs in (i, j) order. Row i discards the smaller circle of each pair (on equal
+    # radii the other one) and, like the original double loop, keeps going after discarding itself.
+    rows, cols = np.nonzero(nested)
+    row_is_smaller = (r[rows] < r[cols]).tolist()
+    keep = keep.tolist()
+    current_row, row_active = -1, False
+    for i, j, i_smaller in zip(rows.tolist(), cols.tolist(), row_is_smaller):
+        if i != current_row: current_row, row_active = i, keep[i]
+        if not row_active or not keep[j]: continue
+        keep[i if i_smaller else j] = False
+    return np.array(keep, dtype=bool)
+
 def filter_nested_circles(circles):
-    discarded_indices = set()
-    for i, c1 in enumerate(circles):
-        if i in discarded_indices: continue
-        for j, c2 in enumerate(circles):
-            if i == j or j in discarded_indices: continue
-            smaller, larger = (c1, c2) if c1[2] < c2[2] else (c2, c1)
-            smaller_idx, larger_idx = (i, j) if c1[2] < c2[2] else (j, i)
-            intersection = circle_intersection_area(smaller, larger)
-            area_smaller = np.pi * float(smaller[2])**2
-            if area_smaller == 0: continue
-            if intersection / area_smaller > 0.8:
-                discarded_indices.add(smaller_idx)
-    return [c for i, c in enumerate(circles) if i not in discarded_indices]
+    keep = nested_circle_keep_mask(circles)
+    return [c for c, k in zip(circles, keep) if k]
 
 def load_templates(template_dir):
     known_colors = {} 
@@ -178,129 +427,725 @@ def load_templates(template_dir):
                     not_cat_colors.append(color)
     return known_colors, not_cat_colors, radius_ranges
 
-def get_cat_census_and_next(board_img, next_cat_img, mask, known_colors, not_cat_colors, radius_ranges):
+def compile_templates(known_colors, not_cat_colors, radius_ranges, lut=None):
     """
-    Analyzes the board and next cat image to return the census, next cat type, and pile height.
+    Packs the template library into flat arrays (one row per exemplar) so every circle in a
+    frame can be classified with a single broadcasted distance computation.
+    Rows keep the iteration order of known_colors, so ties resolve exactly like the old loops.
+    Pass a lut from load_color_lut() to classify circles by a vote over per-pixel labels instead.
     """
-    # --- Process Board ---
-    raw_circles = find_candidate_circles(board_img, mask)
-    valid_cat_circles = []
-    
-    for (cx, cy, r) in raw_circles:
-        cx, cy, r = int(cx), int(cy), int(r)
-        if r < 15: continue 
+    colors, class_ids, min_radii, max_radii = [], [], [], []
+    for t_id, templates in known_colors.items():
+        min_r, max_r = radius_ranges.get(t_id, (-np.inf, np.inf))
+        for template in templates:
+            colors.append(template['color'])
+            class_ids.append(t_id)
+            min_radii.append(min_r)
+            max_radii.append(max_r)
 
-        if r < 20: patch_radius = int(r * 0.90)
-        else: patch_radius = int(r * 0.60)
-        
-        x1, y1 = max(0, cx - patch_radius), max(0, cy - patch_radius)
-        x2, y2 = min(board_img.shape[1], cx + patch_radius), min(board_img.shape[0], cy + patch_radius)
-        patch = board_img[y1:y2, x1:x2]
-        
+    index = {
+        "colors": np.array(colors, dtype=np.float32).reshape(-1, 3),
+        "class_ids": np.array(class_ids, dtype=np.int32),
+        "min_r": np.array(min_radii, dtype=np.float32),
+        "max_r": np.array(max_radii, dtype=np.float32),
+        "not_cat_colors": np.array(not_cat_colors, dtype=np.float32).reshape(-1, 3),
+    }
+    if lut is not None:
+        # Radius range of every LUT code; the not-a-cat and unknown codes never win a vote
+        lut_min_r, lut_max_r = np.full(256, np.inf, dtype=np.float32), np.full(256, -np.inf, dtype=np.float32)
+        for t_id in known_colors:
+            if 0 <= t_id < MAX_CAT_TYPES:
+                lut_min_r[t_id + LUT_FIRST_CLASS], lut_max_r[t_id + LUT_FIRST_CLASS] = radius_ranges.get(t_id, (-np.inf, np.inf))
+        index.update({"lut": lut, "lut_min_r": lut_min_r, "lut_max_r": lut_max_r})
+    return index
+
+# --- Color Lookup Table ---
+# Every BGR color, quantized to LUT_BITS per channel, maps to a label: not-a-cat, unknown, or cat class + LUT_FIRST_CLASS.
+LUT_BITS = 6
+LUT_NOT_A_CAT, LUT_UNKNOWN, LUT_FIRST_CLASS = 0, 1, 2
+LUT_MIN_VOTE_FRACTION = 0.25  # Share of a circle's core a class needs to claim it
+LUT_CACHE_DIR = "template_cache"
+CLASSIFIER = os.environ.get("FITCATS_CLASSIFIER", "colors")  # "colors" (dominant color per circle) or "lut"
+
+def template_dir_signature(*dirs, extra=""):
+    """Hash of the file list, sizes and mtimes under dirs; changes whenever the library is edited."""
+    h = hashlib.sha1(extra.encode())
+    for d in dirs:
+        h.update(f"[{os.path.basename(os.path.normpath(d))}]\n".encode())
+        for root, subdirs, files in os.walk(d):
+            subdirs.sort()
+            for name in sorted(files):
+                st = os.stat(os.path.join(root, name))
+                h.update(f"{os.path.relpath(os.path.join(root, name), d)}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    return h.hexdigest()[:16]
+
+def build_color_lut(known_colors, not_cat_colors, bits=LUT_BITS, chunk=4096):
+    """Labels the center of every quantized color bin the way classify_colors/find_not_a_cat label a dominant color, ignoring radius."""
+    n = 1 << bits
+    step = 256 >> bits
+    levels = np.arange(n, dtype=np.float32) * step + (step - 1) / 2.0
+    centers = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1).reshape(-1, 3)
+    index = compile_templates(known_colors, not_cat_colors, {})
+    codes = np.where((index["class_ids"] >= 0) & (index["class_ids"] < MAX_CAT_TYPES), index["class_ids"] + LUT_FIRST_CLASS, LUT_UNKNOWN)
+
+    lut = np.full(len(centers), LUT_UNKNOWN, dtype=np.uint8)
+    for start in range(0, len(centers), chunk):
+        colors = centers[start:start + chunk]
+        labels = lut[start:start + chunk]
+        if len(index["colors"]) > 0:
+            dist_sq = _color_dist_sq(colors, index["colors"])
+            best = np.argmin(dist_sq, axis=1)
+            matched = dist_sq[np.arange(len(colors)), best] < COLOR_DIST_THRESHOLD ** 2
+            labels[matched] = codes[best[matched]]
+        if len(index["not_cat_colors"]) > 0:
+            labels[(_color_dist_sq(colors, index["not_cat_colors"]) < COLOR_DIST_THRESHOLD ** 2).any(axis=1)] = LUT_NOT_A_CAT
+    return lut.reshape(n, n, n)
+
+def load_color_lut(template_dir, known_colors, not_cat_colors, cache_dir=LUT_CACHE_DIR, bits=LUT_BITS):
+    """Returns the color LUT for the library, building it only if the cache has none for the current template files."""
+    key = template_dir_signature(template_dir, extra=f"{bits}|{COLOR_DIST_THRESHOLD}|{DOMINANT_COLOR_METHOD}")
+    path = os.path.join(cache_dir, f"color_lut_{key}.npy")
+    if os.path.exists(path): return np.load(path)
+
+    lut = build_color_lut(known_colors, not_cat_colors, bits)
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write then rename, so agents starting together never read a half-written table
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f: np.save(f, lut)
+    os.replace(tmp_path, path)
+    return lut
+
+# --- Compiled Template Index ---
+# The packed library, its LUT and the digit exemplars saved as .npy files under template_cache/index_<key>/.
+# Every agent maps the same files read-only, so N agents share one copy of the pages instead of each
+# decoding the PNGs and running k-means on every template.
+INDEX_VERSION = 2
+INDEX_ARRAYS = ["colors", "class_ids", "min_r", "max_r", "not_cat_colors", "lut", "lut_min_r", "lut_max_r",
+                "digit_pixels", "digit_shapes", "digit_offsets", "digit_labels", "ocr_matrix", "ocr_labels"]
+
+def build_template_index_files(out_dir, cat_dir, digit_dir):
+    known_colors, not_cat_colors, radius_ranges = load_templates(cat_dir)
+    arrays = compile_templates(known_colors, not_cat_colors, radius_ranges, lut=build_color_lut(known_colors, not_cat_colors))
+
+    # Digit exemplars have different shapes, so they are stored back to back with their shapes and offsets
+    digit_templates = get_digit_templates(digit_dir)
+    exemplars = [(int(d), t) for d, templates in sorted(digit_templates.items()) for t in templates]
+    arrays["digit_pixels"] = np.concatenate([t.ravel() for _, t in exemplars]) if exemplars else np.zeros(0, dtype=np.uint8)
+    arrays["digit_shapes"] = np.array([t.shape for _, t in exemplars], dtype=np.int32).reshape(-1, 2)
+    arrays["digit_offsets"] = np.concatenate([[0], np.cumsum([t.size for _, t in exemplars])]).astype(np.int64)
+    arrays["digit_labels"] = np.array([d for d, _ in exemplars], dtype=np.int32)
+    ocr_index = compile_digit_exemplars(digit_templates)
+    arrays["ocr_matrix"], arrays["ocr_labels"] = ocr_index["matrix"], ocr_index["labels"]
+
+    os.makedirs(out_dir)
+    for name in INDEX_ARRAYS:
+        np.save(os.path.join(out_dir, f"{name}.npy"), arrays[name])
+
+def load_template_index(cat_dir="./cat_templates", digit_dir="digit_templates", cache_dir=LUT_CACHE_DIR, classifier=None):
+    """
+    Returns (template_index, digit_templates, ocr_index) backed by the compiled index of the two template
+    directories, building it first if the library changed since it was last compiled.
+    """
+    key = template_dir_signature(cat_dir, digit_dir, extra=f"{INDEX_VERSION}|{LUT_BITS}|{COLOR_DIST_THRESHOLD}|{DOMINANT_COLOR_METHOD}")
+    path = os.path.join(cache_dir, f"index_{key}")
+    if not os.path.isdir(path):
+        # Build in a private directory and rename it into place; if another agent got there first, keep theirs
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        build_template_index_files(tmp_path, cat_dir, digit_dir)
+        try: os.rename(tmp_path, path)
+        except OSError: shutil.rmtree(tmp_path, ignore_errors=True)
+
+    arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r') for name in INDEX_ARRAYS}
+    template_index = {name: arrays[name] for name in ["colors", "class_ids", "min_r", "max_r", "not_cat_colors"]}
+    if (classifier or CLASSIFIER) == "lut":
+        template_index.update({name: arrays[name] for name in ["lut", "lut_min_r", "lut_max_r"]})
+
+    digit_templates = {}
+    offsets = arrays["digit_offsets"]
+    for i, (label, shape) in enumerate(zip(arrays["digit_labels"], arrays["digit_shapes"])):
+        digit_templates.setdefault(str(label), []).append(arrays["digit_pixels"][offsets[i]:offsets[i + 1]].reshape(shape))
+    ocr_index = {"matrix": arrays["ocr_matrix"], "labels": arrays["ocr_labels"]}
+    return template_index, digit_templates, ocr_index
+
+def color_label_map(img, lut):
+    """Per-pixel LUT labels of a BGR image, in one table lookup."""
+    shift = 8 - int(np.log2(lut.shape[0]))
+    q = (img >> shift).astype(np.intp)
+    return lut.ravel()[(q[..., 0] * lut.shape[1] + q[..., 1]) * lut.shape[2] + q[..., 2]]
+
+def vote_classes(label_patches, radii, template_index, radius_tolerance=0.0):
+    """
+    Classifies circles by the labels inside their core: not-a-cat if that is the most common label,
+    otherwise the radius-compatible class (within radius_tolerance px) with the most votes. Returns (not_cat, class_ids).
+    """
+    not_cat = np.zeros(len(label_patches), dtype=bool)
+    class_ids = np.full(len(label_patches), -1, dtype=np.int32)
+    for i, (labels, r) in enumerate(zip(label_patches, radii)):
+        if labels.shape[0] < 5 or labels.shape[1] < 5: continue
+        votes = np.bincount(labels.ravel(), minlength=256)
+        if np.argmax(votes) == LUT_NOT_A_CAT:
+            not_cat[i] = True
+            continue
+        eligible = (r >= template_index["lut_min_r"] - radius_tolerance) & (r <= template_index["lut_max_r"] + radius_tolerance)
+        best = np.argmax(np.where(eligible, votes, 0))
+        if eligible[best] and votes[best] >= LUT_MIN_VOTE_FRACTION * labels.size:
+            class_ids[i] = best - LUT_FIRST_CLASS
+    return not_cat, class_ids
+
+def get_candidate_patch(img, cx, cy, r, scale=1.0):
+    """The square core of a circle that its color is sampled from. Radii are in pixels of img, which is `scale` times full size."""
+    if r < 20 * scale: patch_radius = int(r * 0.90)
+    else: patch_radius = int(r * 0.60)
+
+    x1, y1 = max(0, cx - patch_radius), max(0, cy - patch_radius)
+    x2, y2 = min(img.shape[1], cx + patch_radius), min(img.shape[0], cy + patch_radius)
+    return img[y1:y2, x1:x2]
+
+def scale_radius_tolerance(scale):
+    """Slack on template radius ranges for a board resized by `scale`: one of its pixels, in full-size pixels."""
+    return 1.0 / scale if scale < 1 else 0.0
+
+def get_candidate_circles(raw_circles, scale=1.0):
+    """Candidates of at least 15px (at full size) as (cx, cy, r) int rows."""
+    circles = np.asarray(raw_circles, dtype=np.int32).reshape(-1, 3)
+    return circles[circles[:, 2] >= 15 * scale]
+
+def patch_colors(patches):
+    """Dominant color of each patch. Returns (colors, has_color); rows where the patch was too small have has_color False."""
+    colors, has_color = [], []
+    for patch in patches:
         dominant_color = get_dominant_color(patch)
-        is_not_a_cat = False
-        if dominant_color is not None:
-            for not_cat_color in not_cat_colors:
-                if np.linalg.norm(dominant_color.astype(np.float32) - not_cat_color.astype(np.float32)) < COLOR_DIST_THRESHOLD:
-                    is_not_a_cat = True
-                    break
-        
-        if not is_not_a_cat:
-            valid_cat_circles.append((cx, cy, r, dominant_color))
+        colors.append(dominant_color if dominant_color is not None else (0, 0, 0))
+        has_color.append(dominant_color is not None)
+    return np.array(colors, dtype=np.float32).reshape(-1, 3), np.array(has_color, dtype=bool)
 
-    circles_to_filter = np.array([(c[0], c[1], c[2]) for c in valid_cat_circles], dtype=np.uint16) if valid_cat_circles else []
-    final_circles = filter_nested_circles(circles_to_filter) if len(circles_to_filter) > 0 else []
+def get_candidate_colors(img, raw_circles):
+    """
+    Drops candidates smaller than 15px and samples the dominant color of each remaining circle's core.
+    Returns (circles, colors, has_color).
+    """
+    circles = get_candidate_circles(raw_circles)
+    colors, has_color = patch_colors([get_candidate_patch(img, cx, cy, r) for cx, cy, r in circles])
+    return circles, colors, has_color
+
+def _color_dist_sq(colors, reference_colors):
+    # Colors are whole numbers, so float32 squared distances are exact and compare
+    # against COLOR_DIST_THRESHOLD**2 exactly like the old per-pair np.linalg.norm.
+    diff = colors[:, None, :] - reference_colors[None, :, :]
+    return np.einsum('ijk,ijk->ij', diff, diff)
+
+def find_not_a_cat(colors, has_color, template_index):
+    """Flags every row whose color is within COLOR_DIST_THRESHOLD of any not-a-cat exemplar."""
+    not_cat_colors = template_index["not_cat_colors"]
+    if len(colors) == 0 or len(not_cat_colors) == 0:
+        return np.zeros(len(colors), dtype=bool)
+    dist_sq = _color_dist_sq(colors, not_cat_colors)
+    return has_color & (dist_sq < COLOR_DIST_THRESHOLD ** 2).any(axis=1)
+
+def classify_colors(colors, radii, has_color, template_index, radius_tolerance=0.0):
+    """
+    Labels every row with the class of its nearest radius-compatible template (within radius_tolerance px),
+    or -1 when no template is closer than COLOR_DIST_THRESHOLD.
+    """
+    class_ids = np.full(len(colors), -1, dtype=np.int32)
+    template_colors = template_index["colors"]
+    if len(colors) == 0 or len(template_colors) == 0:
+        return class_ids
+
+    dist_sq = _color_dist_sq(colors, template_colors)
+    radii = np.asarray(radii, dtype=np.float32)[:, None]
+    in_range = (radii >= template_index["min_r"] - radius_tolerance) & (radii <= template_index["max_r"] + radius_tolerance)
+    dist_sq = np.where(in_range, dist_sq, np.inf)
+
+    best = np.argmin(dist_sq, axis=1)
+    matched = has_color & (dist_sq[np.arange(len(colors)), best] < COLOR_DIST_THRESHOLD ** 2)
+    class_ids[matched] = template_index["class_ids"][best[matched]]
+    class_ids[class_ids >= MAX_CAT_TYPES] = -1
+    return class_ids
+
+def classify_patches(patches, radii, template_index, radius_tolerance=0.0):
+    """Classifies candidate core patches (BGR) with the index's LUT if it has one, else by dominant color. Returns (not_cat, class_ids)."""
+    with span("classify", patches=len(patches)):
+        return _classify_patches(patches, radii, template_index, radius_tolerance)
+
+def _classify_patches(patches, radii, template_index, radius_tolerance):
+    if "lut" in template_index:
+        return vote_classes([color_label_map(p, template_index["lut"]) for p in patches], radii, template_index, radius_tolerance)
+    colors, has_color = patch_colors(patches)
+    return find_not_a_cat(colors, has_color, template_index), classify_colors(colors, radii, has_color, template_index, radius_tolerance)
+
+def classify_candidates(img, raw_circles, template_index, scale=1.0):
+    """
+    Drops candidates smaller than 15px and classifies the rest. Returns (circles, not_cat, class_ids).
+    img may be a board resized by `scale`; radii are matched against the templates in full-size pixels.
+    """
+    circles = get_candidate_circles(raw_circles, scale)
+    radii, tolerance = circles[:, 2] / scale, scale_radius_tolerance(scale)
+    if "lut" in template_index:
+        # Label the whole image once and let every circle vote over its slice of the map
+        with span("label_map"): labels = color_label_map(img, template_index["lut"])
+        with span("classify", patches=len(circles)):
+            return (circles,) + vote_classes([get_candidate_patch(labels, cx, cy, r, scale) for cx, cy, r in circles], radii, template_index, tolerance)
+    return (circles,) + classify_patches([get_candidate_patch(img, cx, cy, r, scale) for cx, cy, r in circles], radii, template_index, tolerance)
+
+def census_from_classes(board_shape, circles, not_cat, class_ids):
+    """
+    Drops not-a-cat circles, runs nested-circle suppression on the rest and counts the survivors.
+    Returns (census, pile_height, cats) where cats holds one (cx, cy, r, class_id) row per surviving circle.
+    """
+    circles, class_ids = circles[~not_cat], class_ids[~not_cat]
+    keep = nested_circle_keep_mask(circles)
+    final_circles, class_ids = circles[keep], class_ids[keep]
 
     census = np.zeros(MAX_CAT_TYPES, dtype=np.float32)
-    min_y = board_img.shape[0] # Default to bottom of screen (empty)
-    
-    claw_zone_y = int(board_img.shape[0] * 0.15)
+    min_y = board_shape[0] # Default to bottom of screen (empty)
 
-    for (cx, cy, r) in final_circles:
-        cat_top = int(cy) - int(r)
-        
-        if cy > claw_zone_y:
-            if cat_top < min_y:
-                min_y = cat_top
-
-        match = None
-        for vc in valid_cat_circles:
-            if vc[0] == cx and vc[1] == cy and vc[2] == r:
-                match = vc
-                break
-        if not match: continue
-        _, _, _, dominant_color = match
-
-        if dominant_color is not None:
-            best_match_id = -1
-            min_dist = COLOR_DIST_THRESHOLD
-            for t_id, templates in known_colors.items():
-                if t_id in radius_ranges:
-                    min_r, max_r = radius_ranges[t_id]
-                    if not (min_r <= r <= max_r):
-                        continue 
-
-                for template in templates:
-                    dist = np.linalg.norm(dominant_color.astype(np.float32) - template['color'].astype(np.float32))
-                    if dist < min_dist:
-                        min_dist = dist
-                        best_match_id = t_id
-            
-            if best_match_id != -1 and best_match_id < MAX_CAT_TYPES:
-                census[best_match_id] += 1
-    
-    pile_height = 1.0 - (min_y / board_img.shape[0])
+    if len(final_circles) > 0:
+        claw_zone_y = int(board_shape[0] * 0.15)
+        below_claw = final_circles[:, 1] > claw_zone_y
+        if below_claw.any():
+            min_y = min(min_y, int((final_circles[below_claw, 1] - final_circles[below_claw, 2]).min()))
+        census += np.bincount(class_ids[class_ids != -1], minlength=MAX_CAT_TYPES).astype(np.float32)
+
+    pile_height = 1.0 - (min_y / board_shape[0])
     pile_height = max(0.0, min(1.0, pile_height))
+    cats = np.column_stack([final_circles, class_ids]).astype(np.int32).reshape(-1, 4)
+    return census, pile_height, cats
 
-    # --- Process Next Cat ---
-    next_cat_type = -1 
-    
-    raw_circles_next = find_candidate_circles(next_cat_img)
-    valid_next_circles = []
-    for (cx, cy, r) in raw_circles_next:
-        cx, cy, r = int(cx), int(cy), int(r)
-        if r < 15: continue
-
-        if r < 20: patch_radius = int(r * 0.90)
-        else: patch_radius = int(r * 0.60)
-        x1, y1 = max(0, cx - patch_radius), max(0, cy - patch_radius)
-        x2, y2 = min(next_cat_img.shape[1], cx + patch_radius), min(next_cat_img.shape[0], cy + patch_radius)
-        patch = next_cat_img[y1:y2, x1:x2]
-        dominant_color = get_dominant_color(patch)
-        
-        is_not_a_cat = False
-        if dominant_color is not None:
-            for not_cat_color in not_cat_colors:
-                if np.linalg.norm(dominant_color.astype(np.float32) - not_cat_color.astype(np.float32)) < COLOR_DIST_THRESHOLD:
-                    is_not_a_cat = True
-                    break
-        if not is_not_a_cat:
-             valid_next_circles.append((cx, cy, r, dominant_color))
+def census_from_candidates(board_shape, circles, colors, has_color, template_index):
+    """census_from_classes() for candidates classified by dominant color."""
+    not_cat = find_not_a_cat(colors, has_color, template_index)
+    class_ids = classify_colors(colors, circles[:, 2], has_color, template_index)
+    return census_from_classes(board_shape, circles, not_cat, class_ids)
 
-    if valid_next_circles:
-        best_next_cat = max(valid_next_circles, key=lambda c: c[2])
-        _, _, _, dominant_color = best_next_cat
-        
-        if dominant_color is not None:
-            best_match_id = -1
-            min_dist = COLOR_DIST_THRESHOLD
-            for t_id, templates in known_colors.items():
-                if t_id in radius_ranges:
-                    min_r, max_r = radius_ranges[t_id]
-                    if not (min_r <= best_next_cat[2] <= max_r):
-                        continue
-
-                for template in templates:
-                    dist = np.linalg.norm(dominant_color.astype(np.float32) - template['color'].astype(np.float32))
-                    if dist < min_dist:
-                        min_dist = dist
-                        best_match_id = t_id
-            
-            if best_match_id != -1 and best_match_id < MAX_CAT_TYPES:
-                next_cat_type = best_match_id
+def get_board_census(board_img, mask, template_index, detector=find_candidate_circles, scale=1.0):
+    """Returns the census and pile height of the board (resized by `scale`, with a detector made for that scale)."""
+    raw_circles = detector(board_img, mask)
+    circles, not_cat, class_ids = classify_candidates(board_img, raw_circles, template_index, scale)
+    census, pile_height, _ = census_from_classes(board_img.shape, circles, not_cat, class_ids)
+    return census, pile_height
 
+def get_next_cat_type(next_cat_img, template_index):
+    """Classifies the largest cat-colored circle in the next-cat box, or -1."""
+    raw_circles = find_candidate_circles(next_cat_img)
+    circles, not_cat, class_ids = classify_candidates(next_cat_img, raw_circles, template_index)
+    if not_cat.all(): return -1
+    return int(class_ids[~not_cat][np.argmax(circles[~not_cat, 2])])
+
+def get_cat_census_and_next(board_img, next_cat_img, mask, known_colors, not_cat_colors, radius_ranges, template_index=None):
+    """
+    Analyzes the board and next cat image to return the census, next cat type, and pile height.
+    Pass a template_index from compile_templates() to avoid re-packing the library on every call.
+    """
+    if template_index is None:
+        template_index = compile_templates(known_colors, not_cat_colors, radius_ranges)
+
+    census, pile_height = get_board_census(board_img, mask, template_index)
+    next_cat_type = get_next_cat_type(next_cat_img, template_index)
     return census, next_cat_type, pile_height
 
+# --- Cat Tracking ---
+# Dirty-region gating: boards are diffed at 1/DIFF_DOWNSCALE resolution in DIRTY_TILE_SIZE tiles
+DIFF_DOWNSCALE = 4
+DIRTY_TILE_SIZE = 32        # Full-resolution pixels per tile side
+DIRTY_MARGIN = 32           # Pixels added around each changed area before searching it
+DIRTY_FULL_FRACTION = 0.5   # Above this share of changed tiles the whole board is re-detected
+DIRTY_FULL_EVERY = 8        # Region updates in a row before the whole board is re-detected anyway
+DIRTY_RADIUS_MATCH = 3      # Radius difference within which a circle found in a region is the one seen there before
+
+def shrink_for_diff(img, interpolation=cv2.INTER_AREA):
+    return cv2.resize(img, (img.shape[1] // DIFF_DOWNSCALE, img.shape[0] // DIFF_DOWNSCALE), interpolation=interpolation)
+
+def find_dirty_tiles(previous_small, current_small, mask_small=None, pixel_tolerance=16):
+    """Boolean grid of the DIRTY_TILE_SIZE tiles that changed between two shrink_for_diff() images."""
+    b, g, r = cv2.split(cv2.absdiff(previous_small, current_small))
+    changed = cv2.max(cv2.max(b, g), r) > pixel_tolerance
+    if mask_small is not None: changed &= mask_small > 0
+    t = DIRTY_TILE_SIZE // DIFF_DOWNSCALE
+    rows, cols = -(-changed.shape[0] // t), -(-changed.shape[1] // t)
+    padded = np.zeros((rows * t, cols * t), dtype=bool)
+    padded[:changed.shape[0], :changed.shape[1]] = changed
+    return padded.reshape(rows, t, cols, t).any(axis=(1, 3))
+
+def dirty_regions(tiles, shape, margin=DIRTY_MARGIN):
+    """Bounds each 8-connected group of dirty tiles as an (x0, y0, x1, y1) rect in board pixels, grown by margin."""
+    _, _, stats, _ = cv2.connectedComponentsWithStats(tiles.astype(np.uint8), connectivity=8)
+    t = DIRTY_TILE_SIZE
+    return merge_regions([(max(0, x * t - margin), max(0, y * t - margin), min(shape[1], (x + w) * t + margin), min(shape[0], (y + h) * t + margin))
+                          for x, y, w, h, _ in stats[1:]])
+
+def merge_regions(rects):
+    """Merges (x0, y0, x1, y1) rects that overlap until none do, so no area is searched twice."""
+    rects = [list(r) for r in rects]
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(rects)):
+            for j in range(i + 1, len(rects)):
+                a, b = rects[i], rects[j]
+                if a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]:
+                    rects[i] = [min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])]
+                    rects.pop(j)
+                    merged = True
+                    break
+            if merged: break
+    return [tuple(r) for r in rects]
+
+def circles_in_regions(circles, regions):
+    """True for every circle whose center lies inside one of the rects."""
+    circles = np.asarray(circles, dtype=np.int32).reshape(-1, 3)
+    inside = np.zeros(len(circles), dtype=bool)
+    for (x0, y0, x1, y1) in regions:
+        inside |= (circles[:, 0] >= x0) & (circles[:, 0] < x1) & (circles[:, 1] >= y0) & (circles[:, 1] < y1)
+    return inside
+
+def circle_regions(circles, shape, margin):
+    """Bounding rect of each circle grown by margin (a scalar or one value per circle), clipped to the board."""
+    circles = np.asarray(circles, dtype=np.int32).reshape(-1, 3)
+    grow = circles[:, 2] + np.broadcast_to(np.asarray(margin, dtype=np.int32), len(circles))
+    return [(max(0, int(cx - g)), max(0, int(cy - g)), min(shape[1], int(cx + g + 1)), min(shape[0], int(cy + g + 1)))
+            for (cx, cy, _), g in zip(circles, grow)]
+
+def regions_fraction(regions, shape):
+    """Share of the board covered by non-overlapping rects."""
+    return sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in regions) / float(shape[0] * shape[1])
+
+def circles_touch_regions(circles, regions, margin=0):
+    """True for every circle whose extent (not just its center), grown by margin, reaches into one of the rects."""
+    circles = np.asarray(circles, dtype=np.int32).reshape(-1, 3)
+    cx, cy, r = circles[:, 0], circles[:, 1], circles[:, 2] + margin
+    touch = np.zeros(len(circles), dtype=bool)
+    for (x0, y0, x1, y1) in regions:
+        touch |= (cx + r >= x0) & (cx - r < x1) & (cy + r >= y0) & (cy - r < y1)
+    return touch
+
+class CatTracker:
+    """
+    Keeps the classified cats on the board (position, radius, class) across steps.
+    The board is diffed against the last detected one in low-resolution tiles. If no tile changed,
+    the previous census and pile height are reused outright. Otherwise only the changed tiles (plus a
+    margin) are searched for circles, and earlier candidates centered elsewhere are carried over.
+    A carried circle that comes within DIRTY_MARGIN of a changed area is re-detected too (a circle's Hough
+    votes and radius come from edges beyond its own rim), by adding its own bounds to the search. A circle that vanished from the search may have uncovered one it hid, so its bounds,
+    grown by the largest cat radius, are searched again. The whole board is re-detected when the search
+    would cover more than DIRTY_FULL_FRACTION of it, and every DIRTY_FULL_EVERY region updates in any case.
+    A candidate whose patch still matches the one it was classified from keeps its class, so only
+    new or changed objects pay for classification.
+    """
+    def __init__(self, template_index, patch_tolerance=2.0, pixel_tolerance=16, detector=find_candidate_circles, scale=1.0):
+        self.template_index = template_index
+        self.detector = detector
+        self.scale = scale   # Boards passed to update() are this fraction of full size
+        self.patch_tolerance = patch_tolerance   # Mean absolute difference at which a patch counts as changed
+        self.pixel_tolerance = pixel_tolerance   # Per-channel change, at diff resolution, that marks a tile dirty
+        self.stats = {"updates": 0, "fast_path": 0, "full_detections": 0, "region_updates": 0, "patches_reused": 0, "patches_classified": 0}
+        self.reset()
+
+    def reset(self):
+        self.last_small = None
+        self.region_updates = 0  # Region updates since the board was last detected in full
+        self.raw_circles = np.zeros((0, 3), dtype=np.uint16)
+        self.candidates = {}  # (cx, cy, r) -> (patch, not_cat, class_id) it was classified from
+        self.cats = np.zeros((0, 4), dtype=np.int32)
+        self.census = np.zeros(MAX_CAT_TYPES, dtype=np.float32)
+        self.pile_height = 0.0
+        self.last_update = {"fast_path": 0, "dirty_fraction": 0.0, "patches_reused": 0, "patches_classified": 0}
+        self._mask, self._mask_small = None, None
+
+    def _shrink_mask(self, mask):
+        if mask is None: return None
+        if mask is not self._mask:
+            self._mask, self._mask_small = mask, shrink_for_diff(mask, cv2.INTER_NEAREST)
+        return self._mask_small
+
+    def _candidate_classes(self, board_img, raw_circles):
+        circles = get_candidate_circles(raw_circles, self.scale)
+        patches = [get_candidate_patch(board_img, cx, cy, r, self.scale) for cx, cy, r in circles]
+        not_cat = np.zeros(len(circles), dtype=bool)
+        class_ids = np.full(len(circles), -1, dtype=np.int32)
+        candidates, pending = {}, []
+        for i, ((cx, cy, r), patch) in enumerate(zip(circles, patches)):
+            key = (int(cx), int(cy), int(r))
+            cached = candidates.get(key) or self.candidates.get(key)
+            if cached is not None and cached[0].shape == patch.shape and \
+                    cv2.absdiff(cached[0], patch).mean() <= self.patch_tolerance:
+                not_cat[i], class_ids[i] = cached[1], cached[2]
+                candidates[key] = cached
+            else:
+                pending.append(i)
+
+        # Classify every new or changed patch in one batch
+        if pending:
+            not_cat[pending], class_ids[pending] = classify_patches([patches[i] for i in pending], circles[pending, 2] / self.scale,
+                                                                        self.template_index, scale_radius_tolerance(self.scale))
+            for i in pending:
+                candidates[tuple(int(v) for v in circles[i])] = (patches[i].copy(), not_cat[i], class_ids[i])
+
+        self.candidates = candidates
+        self.last_update["patches_reused"], self.last_update["patches_classified"] = len(circles) - len(pending), len(pending)
+        return circles, not_cat, class_ids
+
+    def _grow_regions(self, regions, shape):
+        """
+        Adds the bounds of every circle that comes within DIRTY_MARGIN of the regions without being centered in
+        them, until none does: re-detecting a circle can shift the ones next to it (minDist, shared edges).
+        Returns the regions, or None once they would cover more than DIRTY_FULL_FRACTION of the board.
+        """
+        while regions_fraction(regions, shape) <= DIRTY_FULL_FRACTION:
+            touched = circles_touch_regions(self.raw_circles, regions, DIRTY_MARGIN) & ~circles_in_regions(self.raw_circles, regions)
+            if not touched.any(): return regions
+            regions = merge_regions(regions + circle_regions(self.raw_circles[touched], shape, DIRTY_MARGIN))
+        return None
+
+    def _detect_regions(self, board_img, mask, regions):
+        """Circles after searching only the regions (grown as needed), or None if the whole board must be searched."""
+        uncover = int(np.ceil(max(band[3] for band in HOUGH_BANDS) * self.scale))
+        for _ in range(2):
+            regions = self._grow_regions(regions, board_img.shape)
+            if regions is None: return None
+            found = np.asarray(self.detector(board_img, mask, regions=regions), dtype=np.uint16).reshape(-1, 3)
+            before = self.raw_circles[circles_in_regions(self.raw_circles, regions)]
+            # A circle that is gone, not just moved within the regions, may have hidden one centered outside them
+            kept = (np.abs(before[:, None, 2].astype(np.int32) - found[None, :, 2]) <= DIRTY_RADIUS_MATCH).any(axis=1)
+            if kept.all():
+                return np.concatenate([self.raw_circles[~circles_in_regions(self.raw_circles, regions)], found])
+            regions = merge_regions(regions + circle_regions(before[~kept], board_img.shape, uncover))
+        return None
+
+    def update(self, board_img, mask):
+        """
+        Returns (census, pile_height) for the board. Full re-detections are get_board_census() itself; region
+        updates are checked against it by bench_perception.py tracker.
+        """
+        with span("board_census"):
+            return self._update(board_img, mask)
+
+    def _update(self, board_img, mask):
+        self.stats["updates"] += 1
+        self.last_update = {"fast_path": 0, "dirty_fraction": 1.0, "patches_reused": 0, "patches_classified": 0}
+
+        small = shrink_for_diff(board_img)
+        regions = None
+        if self.last_small is not None and self.last_small.shape == small.shape:
+            tiles = find_dirty_tiles(self.last_small, small, self._shrink_mask(mask), self.pixel_tolerance)
+            self.last_update["dirty_fraction"] = float(tiles.mean())
+            if not tiles.any():
+                self.last_update["fast_path"] = 1
+                self.stats["fast_path"] += 1
+                return self.census.copy(), self.pile_height
+            if tiles.mean() <= DIRTY_FULL_FRACTION and self.region_updates < DIRTY_FULL_EVERY:
+                regions = dirty_regions(tiles, board_img.shape)
+
+        raw_circles = self._detect_regions(board_img, mask, regions) if regions is not None else None
+        if raw_circles is not None:
+            self.region_updates += 1
+            self.stats["region_updates"] += 1
+        else:
+            raw_circles = self.detector(board_img, mask)
+            self.region_updates = 0
+            self.stats["full_detections"] += 1
+        self.raw_circles = np.asarray(raw_circles, dtype=np.uint16).reshape(-1, 3)
+
+        circles, not_cat, class_ids = self._candidate_classes(board_img, self.raw_circles)
+        self.census, self.pile_height, self.cats = census_from_classes(board_img.shape, circles, not_cat, class_ids)
+        # Diff against the last detected board, not the last frame, so slow drift still registers
+        self.last_small = small
+
+        self.stats["patches_reused"] += self.last_update["patches_reused"]
+        self.stats["patches_classified"] += self.last_update["patches_classified"]
+        return self.census.copy(), self.pile_height
+
+# --- Perception Caches ---
+class ROICache:
+    """
+    LRU cache of a perception result keyed by a CRC32 of the ROI pixels, for regions such as the score
+    and the next-cat preview that show the same few images over and over.
+    """
+    def __init__(self, compute, maxsize=32):
+        self.compute = compute
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = self.misses = 0
+
+    def __call__(self, roi_img):
+        key = (roi_img.shape, zlib.crc32(np.ascontiguousarray(roi_img)))
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        value = self.entries[key] = self.compute(roi_img)
+        if len(self.entries) > self.maxsize: self.entries.popitem(last=False)
+        return value
+
+    def take_counts(self):
+        """(hits, misses) since the last call."""
+        counts = (self.hits, self.misses)
+        self.hits = self.misses = 0
+        return counts
+
+def scale_board(img, scale, interpolation=cv2.INTER_AREA):
+    """The board (or its mask, with INTER_NEAREST) resized for perception at `scale`."""
+    if scale == 1.0: return img
+    return cv2.resize(img, (int(round(img.shape[1] * scale)), int(round(img.shape[0] * scale))), interpolation=interpolation)
+
+def make_cat_mask(calib):
+    """Rasterizes the playable polygon into a mask over the agent view ROI."""
+    agent_view_roi = calib["agent_view_roi"]
+    poly_points = calib["playable_polygon"]
+    mask = np.zeros((agent_view_roi['h'], agent_view_roi['w']), dtype=np.uint8)
+    rel_poly_points = [(px - agent_view_roi['x'], py - agent_view_roi['y']) for px, py in poly_points]
+    pts = np.array(rel_poly_points, np.int32).reshape((-1, 1, 2))
+    cv2.fillPoly(mask, [pts], 255)
+    return mask
+
+def find_template(img, template):
+    """Best TM_CCOEFF_NORMED match of template anywhere in img, as (max_val, max_loc)."""
+    if template is None or img.shape[0] < template.shape[0] or img.shape[1] < template.shape[1]: return 0, (0,0)
+    res = cv2.matchTemplate(img, template, cv2.TM_CCOEFF_NORMED)
+    _, max_val, _, max_loc = cv2.minMaxLoc(res)
+    return max_val, max_loc
+
+GAME_OVER_THRESHOLD = 0.8  # Restart-button match above which the game is over
+
+# --- Game-Over Detection ---
+RESTART_HASH_MATCH_BITS = 8      # dHash distance (scaled to 64 bits) at or below which the window shows the restart button
+RESTART_HASH_MISS_BITS = 20      # ...and at or above which it does not; anything between is ambiguous
+RESTART_HASH_MIN_STEP = 3        # Template steps flatter than this are left out of the hash: noise flips them
+RESTART_FULL_SEARCH_EVERY = 50   # Hash decisions between forced full-frame searches, in case the button moved
+RESTART_CHANGE_FRACTION = 0.25   # Share of frame samples changed since the last call at which a hash miss is re-checked in full
+RESTART_CHANGE_PIXELS = 24       # Per-channel difference at which a frame sample counts as changed
+RESTART_SAMPLES = 32             # Frame samples per side for that comparison
+
+def dhash(img, size=8):
+    """Brightness steps between horizontal neighbours of a size x (size + 1) grayscale thumbnail; their signs are the difference hash."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGRA2GRAY if img.shape[2] == 4 else cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    thumb = cv2.resize(gray, (size + 1, size), interpolation=cv2.INTER_AREA).astype(np.int16)
+    return (thumb[:, 1:] - thumb[:, :-1]).ravel()
+
+class RestartDetector:
+    """
+    Restart-button check that only searches the whole frame until it knows where the button is.
+    The first full-frame match above the threshold fixes the location; after that each frame hashes just the
+    template-sized window there. A clear hit or miss is decided by the hash alone; an ambiguous distance, and
+    every RESTART_FULL_SEARCH_EVERY-th frame, falls back to a full-frame search (which re-learns the location).
+    So does a miss on a frame that changed a lot since the last call (a game-over screen going up), or when
+    the caller says the game has stalled (e.g. a click had no effect): the button may have moved.
+    Frames may be BGR or BGRA. Returns (match, loc) like find_template; hash decisions report 1 - distance / 64 as the match.
+    A partial frame (full_frame=False) is only trusted inside `window`: an ambiguous hash is then settled by
+    matching the window alone, and the full search waits for a caller that grabs a full frame when wants_full_frame.
+    """
+    def __init__(self, template, threshold=GAME_OVER_THRESHOLD, match_bits=RESTART_HASH_MATCH_BITS, miss_bits=RESTART_HASH_MISS_BITS,
+                 full_search_every=RESTART_FULL_SEARCH_EVERY, loc=None):
+        self.template = template
+        self.threshold = threshold
+        self.match_bits, self.miss_bits = match_bits, miss_bits
+        self.full_search_every = full_search_every
+        steps = dhash(template)
+        self.reliable = np.abs(steps) >= RESTART_HASH_MIN_STEP
+        self.signature = steps[self.reliable] > 0
+        self.loc = loc
+        self.since_full_search = 0
+        self.recheck = False  # A miss on a partial frame that a full search should confirm
+        self.last_samples = None
+        self.counts = {"hash_hits": 0, "hash_misses": 0, "window_matches": 0, "rechecks": 0, "full_searches": 0}
+
+    @property
+    def wants_full_frame(self):
+        """Whether the next call will search the whole frame: no location (or hash) yet, or a periodic re-check is due."""
+        return self.loc is None or self.signature.size == 0 or self.recheck or self.since_full_search >= self.full_search_every
+
+    @property
+    def window(self):
+        """(x, y, w, h) of the learned button location, or None."""
+        if self.loc is None: return None
+        return (self.loc[0], self.loc[1], self.template.shape[1], self.template.shape[0])
+
+    def _frame_change(self, img):
+        """Share of a sparse grid of pixels that changed since the previous full frame."""
+        samples = img[::max(1, img.shape[0] // RESTART_SAMPLES), ::max(1, img.shape[1] // RESTART_SAMPLES), :3].astype(np.int16)
+        previous, self.last_samples = self.last_samples, samples
+        if previous is None or previous.shape != samples.shape: return 0.0
+        return float(np.mean(np.abs(samples - previous).max(axis=2) > RESTART_CHANGE_PIXELS))
+
+    def __call__(self, img, full_frame=True, stalled=False):
+        """Match for img (BGR or BGRA). stalled: the game has stopped responding, so a miss is re-checked in full."""
+        changed = self._frame_change(img) >= RESTART_CHANGE_FRACTION if full_frame else False
+        if self.loc is not None and self.signature.size > 0 and not (self.recheck and full_frame) and \
+                (self.since_full_search < self.full_search_every or not full_frame):
+            x, y, w, h = self.window
+            window = img[y:y+h, x:x+w]
+            if window.shape[:2] == (h, w):
+                distance = 64.0 * np.count_nonzero((dhash(window)[self.reliable] > 0) != self.signature) / self.signature.size
+                if distance <= self.match_bits:
+                    self.since_full_search += 1
+                    self.counts["hash_hits"] += 1
+                    return 1.0 - distance / 64.0, self.loc
+                if distance >= self.miss_bits:
+                    if not (full_frame and (changed or stalled)):
+                        self.since_full_search += 1
+                        self.counts["hash_misses"] += 1
+                        self.recheck |= stalled  # A partial frame cannot be searched; the next grab is a full one
+                        return 1.0 - distance / 64.0, self.loc
+                    self.counts["rechecks"] += 1
+                elif not full_frame:
+                    self.since_full_search += 1
+                    self.counts["window_matches"] += 1
+                    if window.shape[2] == 4: window = cv2.cvtColor(window, cv2.COLOR_BGRA2BGR)
+                    return find_template(window, self.template)[0], self.loc
+        self.since_full_search = 0
+        self.recheck = False
+        self.counts["full_searches"] += 1
+        if img.shape[2] == 4: img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+        max_val, max_loc = find_template(img, self.template)
+        if max_val > self.threshold: self.loc = max_loc
+        return max_val, max_loc
+
+    def take_counts(self):
+        """Hash hits, hash misses, window matches, misses re-checked in full and full-frame searches since the last call."""
+        counts = dict(self.counts)
+        for k in self.counts: self.counts[k] = 0
+        return counts
+
+# --- Control Loop ---
+class DeadlineScheduler:
+    """
+    Fixed-rate control loop. wait() sleeps until the next deadline, one period after the previous one, so the
+    click, perception and the policy between steps come out of the period instead of adding to it. A step that
+    reaches wait() after its deadline is a miss, and the schedule restarts from then rather than bursting to
+    catch up. Jitter is how far each wake-up lands from one period after the previous one.
+    """
+    def __init__(self, rate_hz):
+        self.period = 1.0 / rate_hz
+        self.deadline = self.last_tick = None
+        self.counts = {"steps": 0, "deadline_misses": 0, "slack_ms": 0.0, "jitter_ms": 0.0}
+
+    def start(self):
+        """Starts the schedule now, e.g. at the observation reset() returns."""
+        self.deadline = self.last_tick = time.perf_counter()
+
+    def wait(self):
+        """Sleeps until the next deadline. Returns the perf_counter time it woke."""
+        now = time.perf_counter()
+        self.deadline = (now if self.deadline is None else self.deadline) + self.period
+        if now > self.deadline:
+            self.counts["deadline_misses"] += 1
+            self.deadline = now
+        else:
+            self.counts["slack_ms"] += (self.deadline - now) * 1000.0
+            time.sleep(self.deadline - now)
+        tick = time.perf_counter()
+        if self.last_tick is not None: self.counts["jitter_ms"] += abs(tick - self.last_tick - self.period) * 1000.0
+        self.last_tick = tick
+        self.counts["steps"] += 1
+        return tick
+
+    def take_counts(self):
+        """Steps, deadline misses, time slept and summed jitter since the last call."""
+        counts = dict(self.counts)
+        for k in self.counts: self.counts[k] = 0
+        return counts
+
 # --- Main Environment Class ---
 class FitCatsEnv(gym.Env):
     metadata = {"render_modes": ["rgb_array"]}
@@ -308,31 +1153,26 @@ class FitCatsEnv(gym.Env):
     def __init__(self):
         super(FitCatsEnv, self).__init__()
         
-        import pyautogui
-        self.pyautogui = pyautogui
-        self.pyautogui.FAILSAFE = True
+        self.input = make_input()
         
         self.render_mode = "rgb_array"
         self.model_name = os.environ.get("FITCATS_MODEL_NAME", "default")
+        # One transition per drop: the action is just the x bin, and step() returns once the board has settled
+        self.macro_actions = os.environ.get("FITCATS_MACRO_ACTIONS", "0") == "1"
         
         if not os.path.exists("calibration_data.json"): raise FileNotFoundError("calibration_data.json not found! Run setup_agent.py first.")
         with open("calibration_data.json", "r") as f: self.calib = json.load(f)
         
         # Load Templates
-        self.digit_templates = get_digit_templates()
-        self.known_colors, self.not_cat_colors, self.radius_ranges = load_templates("./cat_templates")
+        self.template_index, self.digit_templates, self.ocr_index = load_template_index("./cat_templates", "digit_templates")
         
         if "playable_polygon" not in self.calib or "agent_view_roi" not in self.calib:
             raise ValueError("Calibration data missing 'playable_polygon' or 'agent_view_roi'. Run setup_agent.py.")
 
-        agent_view_roi = self.calib["agent_view_roi"]
-        poly_points = self.calib["playable_polygon"]
-        self.cat_mask = np.zeros((agent_view_roi['h'], agent_view_roi['w']), dtype=np.uint8)
-        rel_poly_points = [(px - agent_view_roi['x'], py - agent_view_roi['y']) for px, py in poly_points]
-        pts = np.array(rel_poly_points, np.int32).reshape((-1, 1, 2))
-        cv2.fillPoly(self.cat_mask, [pts], 255)
+        self.cat_mask = make_cat_mask(self.calib)
+        self.census_mask = scale_board(self.cat_mask, PERCEPTION_SCALE, cv2.INTER_NEAREST)
 
-        self.action_space = spaces.MultiDiscrete([IMG_SIZE, 2])
+        self.action_space = spaces.Discrete(IMG_SIZE) if self.macro_actions else spaces.MultiDiscrete([IMG_SIZE, 2])
         
         # --- Observation Space ---
         self.observation_space = spaces.Dict({
@@ -347,14 +1187,32 @@ class FitCatsEnv(gym.Env):
         self.template_empty_board = cv2.imread("template_empty_board.png", cv2.IMREAD_COLOR)
         
         if any(t is None for t in [self.template_restart, self.template_empty_board]): raise FileNotFoundError("Required template images not found! Run setup_agent.py.")
+        self.restart_detector = RestartDetector(self.template_restart)
+        self.perception_pool = ThreadPoolExecutor(PERCEPTION_THREADS, thread_name_prefix="perception") if PERCEPTION_THREADS > 0 else None
+        # template_empty_board is captured over agent_view_roi, so it doubles as the board background
+        detector = make_detector(background=self.template_empty_board, executor=self.perception_pool, scale=PERCEPTION_SCALE)
+        self.tracker = CatTracker(self.template_index, detector=detector, scale=PERCEPTION_SCALE)
+        self.last_score_reading, self.last_restart_match, self.last_observation_ms = -1, 0.0, 0.0
+        self.stills_since_click = None  # Perception passes since the last click that found the board unchanged; None once it changed
+        self.board_changed = None  # Whether the last full perception pass saw the board change; None if it was skipped
         self.sct = mss.mss()
-        self.game_region = start_game(self.sct, self.calib, self.pyautogui)
+        self.game_region = start_game(self.sct, self.calib, self.input)
+        self.capture = make_capture(self.game_region, sct=self.sct)
+        # With FITCATS_CAPTURE_ROIS, a step grabs only these and the restart button, not the whole game region
+        self.capture_rois = [roi_rect(self.calib[k]) for k in ("agent_view_roi", "next_cat_roi", "score_roi")] if CAPTURE_ROIS else None
         
         self.last_score, self.session_high_score, self.step_count, self.last_click_time, self.consecutive_waits, self.low_score_counter, self.music_muted = 0, 0, 0, time.time(), 0, 0, False
-        self.last_obs_img = None
+        self.last_frame, self.last_observation, self.frames_unchanged, self.last_frame_age_ms = None, None, 0, 0.0
+        self.board_buffers, self.board_buffer_idx = np.zeros((2, IMG_SIZE, IMG_SIZE, 3), dtype=np.uint8), 0
+        # Keyed on the BGRA views of the grab, so a hit converts nothing
+        self.score_cache = ROICache(lambda score_img: self._ocr_score(cv2.cvtColor(score_img, cv2.COLOR_BGRA2BGR)))
+        self.next_cat_cache = ROICache(lambda next_cat_img: get_next_cat_type(cv2.cvtColor(next_cat_img, cv2.COLOR_BGRA2BGR), self.template_index))
         self.last_cat_census = np.zeros(MAX_CAT_TYPES, dtype=np.float32)
         
         self.click_cooldown = 0.0 
+        self.scheduler = DeadlineScheduler(CONTROL_HZ) if CONTROL_HZ > 0 else None
+        self.click_ready_at = 0.0  # With the scheduler, the cooldown is wall-clock: no click before this perf_counter time
+        self.step_pool, self.pending_step = None, None  # step_async(): actuation and perception threads, the step in flight
         # --- KEY FIX: Track episode clicks ---
         self.episode_clicks = 0
         
@@ -373,24 +1231,63 @@ class FitCatsEnv(gym.Env):
             print(f"Loaded {len(self.replay_actions)} actions from replay file: {replay_file}")
 
 
+    @property
+    def last_obs_img(self):
+        """
+        Full BGR frame of the last observation, converted on first use (perception itself only converts its ROIs).
+        With FITCATS_CAPTURE_ROIS, only the perception ROIs of it are from the last step.
+        """
+        return self.last_frame.bgr() if self.last_frame is not None else None
+
     def _find_template(self, img, template):
-        if template is None or img.shape[0] < template.shape[0] or img.shape[1] < template.shape[1]: return 0, (0,0)
-        res = cv2.matchTemplate(img, template, cv2.TM_CCOEFF_NORMED)
-        _, max_val, _, max_loc = cv2.minMaxLoc(res)
-        return max_val, max_loc
+        return find_template(img, template)
+
+    def _restart_match(self, frame):
+        with span("restart_match"):
+            # A click the board did not answer means the game has stopped; the restart button may have moved
+            stalled = self.stills_since_click == 1
+            return self.restart_detector(frame.bgra, full_frame=frame.rects is None, stalled=stalled)[0]
+
+    def _capture_rects(self):
+        """Rects of the game region this step's perception reads, or None for all of it."""
+        if self.capture_rois is None or self.restart_detector.wants_full_frame: return None
+        return merge_rects(self.capture_rois + [self.restart_detector.window])
 
     def _click_template(self, max_loc, template):
         cx, cy = self.game_region['left'] + max_loc[0] + template.shape[1] // 2, self.game_region['top'] + max_loc[1] + template.shape[0] // 2
-        self.pyautogui.click(cx, cy)
+        self.input.click(cx, cy)
 
-    def _read_score(self, img):
+    def _read_score(self, frame):
         try:
-            roi = self.calib["score_roi"]
-            score_img = img[roi['y']:roi['y']+roi['h'], roi['x']:roi['x']+roi['w']]
-            score_text = recognize_score_with_templates(score_img, self.digit_templates)
+            return self.score_cache(frame.roi(self.calib["score_roi"]))
+        except (ValueError, TypeError): return -1
+
+    def _ocr_score(self, score_img):
+        with span("score_ocr", engine=OCR_ENGINE):
+            return self._recognize_score(score_img)
+
+    def _recognize_score(self, score_img):
+        try:
+            if OCR_ENGINE == "matrix": score_text, _ = recognize_score_matrix(score_img, self.ocr_index)
+            else: score_text = recognize_score_with_templates(score_img, self.digit_templates)
             return int(score_text) if score_text else -1
         except (ValueError, TypeError): return -1
 
+    def _perception_info(self):
+        info = {f"perception/tracker_{k}": v for k, v in self.tracker.last_update.items()}
+        info["perception/observation_ms"] = self.last_observation_ms
+        info["perception/frame_bytes_copied"] = self.last_frame.bytes_copied if self.last_frame is not None else 0
+        info["perception/frame_bytes_captured"] = self.last_frame.bytes_captured if self.last_frame is not None else 0
+        info["perception/frames_unchanged"], self.frames_unchanged = self.frames_unchanged, 0
+        info["perception/frame_age_ms"] = self.last_frame_age_ms
+        info.update({f"perception/capture_{k}": v for k, v in self.capture.take_counts().items()})
+        for name, cache in (("score", self.score_cache), ("next_cat", self.next_cat_cache)):
+            info[f"perception/{name}_cache_hits"], info[f"perception/{name}_cache_misses"] = cache.take_counts()
+        info.update({f"perception/restart_{k}": v for k, v in self.restart_detector.take_counts().items()})
+        info.update({f"input/{k}": v for k, v in self.input.take_counts().items()})
+        if self.scheduler is not None: info.update({f"control/{k}": v for k, v in self.scheduler.take_counts().items()})
+        return info
+
     def _update_highscores(self, score, cats, img):
         display = os.environ.get('DISPLAY', ':0')
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -457,107 +1354,248 @@ class FitCatsEnv(gym.Env):
                 except FileNotFoundError:
                     pass 
 
-    def _get_observation(self):
-        img = np.array(self.sct.grab(self.game_region))
-        img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
-        self.last_obs_img = img
+    def _get_observation(self, after=None, in_flight=False):
+        """
+        Observation of the freshest frame captured at or after perf_counter time `after` (default: any).
+        in_flight: an action runs alongside, so whether the board answered the last click is left to the caller.
+        """
+        with span("observation"):
+            return self._observe(after, in_flight)
+
+    def _observe(self, after, in_flight=False):
+        # The grab stays BGRA in the capture's own buffer; only the ROIs perception reads are converted
+        with span("grab"): frame = self.capture.grab(after, self._capture_rects())
+        self.last_frame = frame
+        self.board_changed = None
+        start = time.perf_counter()
+        self.last_frame_age_ms = (start - frame.captured_at) * 1000.0
+        if not frame.changed and self.last_observation is not None:
+            # Nothing was drawn in the game region since the last grab, so every reading still holds
+            self.frames_unchanged += 1
+            self.last_observation_ms = (time.perf_counter() - start) * 1000.0
+            return dict(self.last_observation, time_since_click=np.array([time.time() - self.last_click_time], dtype=np.float32))
         
         roi = self.calib["agent_view_roi"]
-        board_img = img[roi['y']:roi['y']+roi['h'], roi['x']:roi['x']+roi['w']]
-        board_obs = cv2.resize(board_img, (IMG_SIZE, IMG_SIZE))
+        with span("resize"):
+            # Alternate between two buffers, so the previous observation stays intact for one more step
+            self.board_buffer_idx ^= 1
+            board_obs = frame.resize_bgr(roi, (IMG_SIZE, IMG_SIZE), dst=self.board_buffers[self.board_buffer_idx])
+            if PERCEPTION_SCALE == 1.0: census_board = frame.bgr(roi)
+            else: census_board = frame.resize_bgr(roi, self.census_mask.shape[::-1], interpolation=cv2.INTER_AREA)
         
-        roi_next = self.calib["next_cat_roi"]
-        next_cat_img = img[roi_next['y']:roi_next['y']+roi_next['h'], roi_next['x']:roi_next['x']+roi_next['w']]
+        next_cat_img = frame.roi(self.calib["next_cat_roi"])
         
         time_delta = time.time() - self.last_click_time
         
-        cat_census, next_cat_type, pile_height = get_cat_census_and_next(board_img, next_cat_img, self.cat_mask, self.known_colors, self.not_cat_colors, self.radius_ranges)
+        # Next cat, score and restart button are independent of the board; with a pool they run alongside it
+        stages = [lambda: self.next_cat_cache(next_cat_img),
+                  lambda: self._read_score(frame),
+                  lambda: self._restart_match(frame)]
+        if self.perception_pool is not None:
+            futures = [self.perception_pool.submit(stage) for stage in stages]
+            cat_census, pile_height = self.tracker.update(census_board, self.census_mask)
+            next_cat_type, self.last_score_reading, self.last_restart_match = [f.result() for f in futures]
+        else:
+            cat_census, pile_height = self.tracker.update(census_board, self.census_mask)
+            next_cat_type, self.last_score_reading, self.last_restart_match = [stage() for stage in stages]
+        self.board_changed = self.tracker.last_update["dirty_fraction"] > 0
+        if not in_flight: self._board_answered(self.board_changed)
+        self.last_observation_ms = (time.perf_counter() - start) * 1000.0
         
         next_cat_one_hot = np.zeros(MAX_CAT_TYPES, dtype=np.float32)
         if next_cat_type != -1 and next_cat_type < MAX_CAT_TYPES:
             next_cat_one_hot[next_cat_type] = 1.0
 
-        return {
+        self.last_observation = {
             "board": board_obs, 
             "next_cat_type": next_cat_one_hot,
             "time_since_click": np.array([time_delta], dtype=np.float32),
             "cat_census": cat_census,
             "pile_height": np.array([pile_height], dtype=np.float32)
         }
+        return self.last_observation
+
+    def _board_answered(self, changed):
+        if self.stills_since_click is None: return
+        self.stills_since_click = None if changed else self.stills_since_click + 1
 
     def step(self, action):
+        t0 = time.perf_counter()
+        with span("step"):
+            obs, reward, terminated, truncated, info = self._step(action)
+        info["step/wall_ms"] = (time.perf_counter() - t0) * 1000.0
+        return obs, reward, terminated, truncated, info
+
+    def step_async(self, action):
+        """
+        Starts a step without waiting for it; step_wait() returns it. The action is issued on one thread while
+        perception of the latest frame runs on another, so the click's latency and sleeps overlap the OpenCV work
+        instead of preceding it. The observation is therefore of the frame at hand when the action was issued
+        (about one step behind the action, where step() observes after it). Macro actions have to observe after
+        the drop, so they just run step() on the thread. The action's bookkeeping (click time, waits, stall count)
+        is applied in step_wait(), after the observation, so perception never sees it half done.
+        """
+        if self.pending_step is not None: raise RuntimeError("step_async() called again before step_wait()")
+        if self.step_pool is None: self.step_pool = ThreadPoolExecutor(2, thread_name_prefix="step")
+        timed = lambda fn, *args: (fn(*args), time.perf_counter())
+        t0 = time.perf_counter()
+        if self.macro_actions: self.pending_step = (t0, self.step_pool.submit(self.step, action), None)
+        else: self.pending_step = (t0, self.step_pool.submit(timed, self._act, action), self.step_pool.submit(timed, self._get_observation, None, True))
+
+    def step_wait(self):
+        if self.pending_step is None: raise RuntimeError("step_wait() called without step_async()")
+        t0, act, observe = self.pending_step
+        self.pending_step = None
+        if observe is None: return act.result()
+        with span("step_wait"):
+            ((x_bin, attempted_click, did_click, _, clicked_at), acted), (obs, observed) = act.result(), observe.result()
+            # The frame only answers the last click if no new one went out while it was being captured
+            if not did_click and self.board_changed is not None: self._board_answered(self.board_changed)
+            self._record_action(clicked_at)
+            obs, reward, terminated, truncated, info = self._finish(obs, x_bin, attempted_click, did_click)
+        info["step/actuation_ms"], info["step/perception_ms"] = (acted - t0) * 1000.0, (observed - t0) * 1000.0
+        info["step/wall_ms"] = (time.perf_counter() - t0) * 1000.0
+        return obs, reward, terminated, truncated, info
+
+    def _step(self, action):
+        if self.macro_actions: return self._macro_step(action)
+        t0 = time.perf_counter()
+        x_bin, attempted_click, did_click, action_done, clicked_at = self._act(action)
+        self._record_action(clicked_at)
+        acted = time.perf_counter()
+        # A background capture may already hold a frame from after the action; otherwise this waits for one
+        obs = self._get_observation(after=action_done)
+        observed = time.perf_counter()
+        obs, reward, terminated, truncated, info = self._finish(obs, x_bin, attempted_click, did_click)
+        info["step/actuation_ms"], info["step/perception_ms"] = (acted - t0) * 1000.0, (observed - acted) * 1000.0
+        return obs, reward, terminated, truncated, info
+
+    def _act(self, action):
+        """
+        Clicks (cooldown permitting) and sleeps out the step. Returns (x_bin, attempted_click, did_click, action_done,
+        clicked_at), for the caller to pass clicked_at to _record_action().
+        """
         self.step_count += 1
         x_bin, click_trigger = action # Unpack discrete action
         
         attempted_click = click_trigger > 0
         
-        if self.click_cooldown > 0:
+        if self.scheduler is not None:
+            did_click = attempted_click and time.perf_counter() >= self.click_ready_at
+        elif self.click_cooldown > 0:
             self.click_cooldown -= 1
             did_click = False 
         else:
             did_click = attempted_click
         
-        old_cat_census = self.last_cat_census.copy()
-
+        clicked_at = None
         if did_click:
-            # Map bin to screen coordinate
-            min_x, max_x = self.calib["click_x_min_rel"], self.calib["click_x_max_rel"]
-            click_x_rel = int((x_bin / (IMG_SIZE - 1)) * (max_x - min_x) + min_x)
-            
-            click_x_abs = self.game_region['left'] + click_x_rel
-            drop_y_abs = self.game_region['top'] + int(self.game_region['height'] * 0.25)
+            action_done, clicked_at = self._drop(x_bin)
+            if self.scheduler is not None: self.click_ready_at = action_done + CLICK_COOLDOWN_SECONDS
+            else: self.click_cooldown = 6 
             
-            # Clamp coordinates to safe range
-            click_x_abs = max(0, min(3000, click_x_abs))
-            drop_y_abs = max(0, min(3000, drop_y_abs))
-            
-            self.pyautogui.moveTo(click_x_abs, drop_y_abs, duration=0.1)
-            self.pyautogui.mouseDown()
-            time.sleep(0.1)
-            self.pyautogui.mouseUp()
-            
-            self.last_click_time = time.time()
-            self.consecutive_waits = 0
-            
-            self.click_cooldown = 6 
-            # --- KEY FIX: Increment episode clicks ---
-            self.episode_clicks += 1
-            
-            time.sleep(0.1)
+            if self.scheduler is None:
+                with span("sleep"): time.sleep(0.1)
         else:
+            action_done = time.perf_counter()
+            if self.scheduler is None:
+                with span("sleep"): time.sleep(0.1)
+        if self.scheduler is not None:
+            # The observation is taken on the deadline; whatever the step has left of its period is slept here
+            with span("sleep"): action_done = self.scheduler.wait()
+        return x_bin, attempted_click, did_click, action_done, clicked_at
+
+    def _record_action(self, clicked_at):
+        """Bookkeeping for a step's action: a drop made at wall time clicked_at, or a wait if None."""
+        if clicked_at is None:
             self.consecutive_waits += 1
-            time.sleep(0.1)
+            return
+        self.last_click_time = clicked_at
+        self.stills_since_click = 0
+        self.consecutive_waits = 0
+        # --- KEY FIX: Increment episode clicks ---
+        self.episode_clicks += 1
 
-        obs = self._get_observation()
-        new_cat_census = obs["cat_census"]
-        self.last_cat_census = new_cat_census.copy()
-        
-        max_cat_type = -1
-        for i in range(MAX_CAT_TYPES - 1, -1, -1):
-            if new_cat_census[i] > 0:
-                max_cat_type = i
-                break
-        
-        old_total_cats = np.sum(old_cat_census)
-        new_total_cats = np.sum(new_cat_census)
-        
-        cat_diff = old_total_cats - new_total_cats
-        
+    def _finish(self, obs, x_bin, attempted_click, did_click):
+        """Reward, game-over check and info for a step observed as obs."""
         if did_click:
             reward = -5.0 # Click Cost
         else:
             reward = 0.0
             
-        if cat_diff > 0:
-            reward += cat_diff * 50.0 # Merge Reward
+        reward += self._merge_reward(obs)
         
         if not did_click:
             if self.consecutive_waits > 50:
                 reward += -0.05 * (1.1 ** (self.consecutive_waits - 50))
         
+        return self._transition(obs, reward, did_click, attempted_click, x_bin)
+
+    def _macro_step(self, action):
+        """
+        One drop per transition: drops at the x bin, then observes every MACRO_POLL_SECONDS (or control period)
+        until the board has been still for MACRO_SETTLE_FRAMES observations in a row, no sooner than the click
+        cooldown and no later than MACRO_MAX_SECONDS. Still means no dirty tiles in the tracker's frame difference.
+        The reward adds up the per-observation rewards of the whole interval.
+        """
+        self.step_count += 1
+        x_bin = int(action)
+        action_done, clicked_at = self._drop(x_bin)
+        self._record_action(clicked_at)
+        reward, polls, still = -5.0, 0, 0 # Click cost
+        while True:
+            if self.scheduler is not None:
+                with span("sleep"): after = self.scheduler.wait()
+            else:
+                with span("sleep"): time.sleep(MACRO_POLL_SECONDS)
+                after = time.perf_counter()
+            obs = self._get_observation(after=after)
+            polls += 1
+            reward += self._merge_reward(obs)
+            elapsed = time.perf_counter() - action_done
+            still = still + 1 if not self.last_frame.changed or self.tracker.last_update["dirty_fraction"] == 0.0 else 0
+            settled = still >= MACRO_SETTLE_FRAMES and elapsed >= CLICK_COOLDOWN_SECONDS
+            if settled or elapsed >= MACRO_MAX_SECONDS or self.last_restart_match > GAME_OVER_THRESHOLD: break
+        obs, reward, terminated, truncated, info = self._transition(obs, reward, True, True, x_bin)
+        info.update({"macro/observations": polls, "macro/settle_ms": elapsed * 1000.0, "macro/timeouts": int(not settled and elapsed >= MACRO_MAX_SECONDS)})
+        return obs, reward, terminated, truncated, info
+
+    def _drop(self, x_bin):
+        """Clicks at the x bin's drop point. Returns (perf_counter time the click was done, its wall time)."""
+        # Map bin to screen coordinate
+        min_x, max_x = self.calib["click_x_min_rel"], self.calib["click_x_max_rel"]
+        click_x_rel = int((x_bin / (IMG_SIZE - 1)) * (max_x - min_x) + min_x)
+        
+        click_x_abs = self.game_region['left'] + click_x_rel
+        drop_y_abs = self.game_region['top'] + int(self.game_region['height'] * 0.25)
+        
+        # Clamp coordinates to safe range
+        click_x_abs = max(0, min(3000, click_x_abs))
+        drop_y_abs = max(0, min(3000, drop_y_abs))
+        
+        with span("click"):
+            self.input.drop(click_x_abs, drop_y_abs)
+        return time.perf_counter(), time.time()
+
+    def _merge_reward(self, obs):
+        """Merge reward for the cats gone since the previous observation, which becomes the new reference."""
+        new_cat_census = obs["cat_census"]
+        cat_diff = np.sum(self.last_cat_census) - np.sum(new_cat_census)
+        self.last_cat_census = new_cat_census.copy()
+        return cat_diff * 50.0 if cat_diff > 0 else 0.0
+
+    def _transition(self, obs, reward, did_click, attempted_click, x_bin):
+        """Game-over check, score reward and info for the step that ended with obs."""
+        new_cat_census = obs["cat_census"]
+        max_cat_type = -1
+        for i in range(MAX_CAT_TYPES - 1, -1, -1):
+            if new_cat_census[i] > 0:
+                max_cat_type = i
+                break
+        
         # Check for game over after reward calculation
-        max_val_r, _ = self._find_template(self.last_obs_img, self.template_restart)
-        if max_val_r > 0.8:
+        max_val_r = self.last_restart_match
+        if max_val_r > GAME_OVER_THRESHOLD:
             display = os.environ.get('DISPLAY', ':0')
             if self.last_score > self.session_high_score:
                 self.session_high_score = self.last_score
@@ -578,11 +1616,12 @@ class FitCatsEnv(gym.Env):
                 "game/final_clicks": self.episode_clicks, # Added
                 "is_game_over": True
             }
+            info.update(self._perception_info())
             
             reward = -1000.0
             return obs, reward, True, False, info
 
-        current_score = self._read_score(self.last_obs_img)
+        current_score = self.last_score_reading
         
         score_increased = 0.0
         if current_score > self.last_score:
@@ -601,11 +1640,13 @@ class FitCatsEnv(gym.Env):
             "game/action_x": x_bin,
             "is_game_over": False
         }
+        info.update(self._perception_info())
         
         return obs, reward, False, False, info
 
     def reset(self, seed=None, options=None):
         super().reset(seed=seed)
+        if self.pending_step is not None: self.step_wait()  # Let a step_async() in flight finish before resetting
         
         # --- KEY FIX: Print stats on reset ---
         display = os.environ.get('DISPLAY', ':0')
@@ -616,7 +1657,10 @@ class FitCatsEnv(gym.Env):
         self.last_click_time = time.time()
         self.consecutive_waits = 0
         self.click_cooldown = 0 
+        self.click_ready_at = 0.0
         self.episode_clicks = 0 # Reset clicks
+        self.stills_since_click = None
+        self.tracker.reset()
         
         print(f"[{display}] --- Resetting Environment ---")
         
@@ -630,7 +1674,7 @@ class FitCatsEnv(gym.Env):
                 current_replay_time = time.time() - self.replay_start_time
                 
                 if current_replay_time >= action['t']:
-                    self.pyautogui.click(action['x'], action['y'])
+                    self.input.click(action['x'], action['y'])
                     self.replay_idx += 1
                     time.sleep(0.1) 
                 else:
@@ -640,28 +1684,37 @@ class FitCatsEnv(gym.Env):
             time.sleep(2) 
 
         while True:
-            img = np.array(self.sct.grab(self.game_region))
-            img = cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
+            # Only frames captured from here on: a capture thread may still hold one from before the restart click
+            checked_at = time.perf_counter()
+            img = self.capture.grab(after=checked_at).bgr()
             
-            max_val_r, max_loc_r = self._find_template(img, self.template_restart)
-            if max_val_r > 0.8:
+            max_val_r, max_loc_r = self.restart_detector(img)
+            if max_val_r > GAME_OVER_THRESHOLD:
                 self._click_template(max_loc_r, self.template_restart)
                 time.sleep(2)
                 continue
             
             max_val_b, _ = self._find_template(img, self.template_empty_board)
             if max_val_b > 0.8:
-                initial_obs = self._get_observation()
-                self.last_score = self._read_score(self.last_obs_img) if self._read_score(self.last_obs_img) != -1 else 0
+                # Nothing the last episode perceived carries over: score, census and restart match are read afresh
+                # even if the capture reports the frame unchanged (it only compares with the grab just above)
+                self.last_observation = None
+                initial_obs = self._get_observation(after=checked_at)
+                self.last_score = self.last_score_reading if self.last_score_reading != -1 else 0
                 self.last_cat_census = initial_obs["cat_census"].copy()
+                if self.scheduler is not None: self.scheduler.start()
                 return initial_obs, {}
             
             print(f"[{display}] Waiting for game to be ready for reset...")
             time.sleep(1)
 
     def render(self):
-        if self.render_mode == "rgb_array" and self.last_obs_img is not None:
+        if self.render_mode == "rgb_array" and self.last_frame is not None:
             return self.last_obs_img
         return None
 
-    def close(self): pass
+    def close(self):
+        if self.perception_pool is not None: self.perception_pool.shutdown(wait=False)
+        if self.step_pool is not None: self.step_pool.shutdown(wait=True)
+        self.capture.close()
+        self.input.close()
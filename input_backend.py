@@ -0,0 +1,104 @@
+import os
+import time
+
+# Mouse input for the env. pyautogui tweens every move and sleeps pyautogui.PAUSE after every call, so one
+# drop costs several hundred ms; the "xtest" backend sends an instant pointer warp, press and release to the
+# agent's own display through the XTest extension and returns as soon as the X server has them.
+
+INPUT_BACKEND = os.environ.get("FITCATS_INPUT", "pyautogui")
+CLICK_HOLD_SECONDS = float(os.environ.get("FITCATS_CLICK_HOLD_MS", "0")) / 1000.0  # xtest: time between press and release
+
+# --- Backends ---
+# A backend has drop(x, y) and click(x, y) in screen coordinates of the agent's display, take_counts() and close().
+# drop() is the agent's action and is counted; click() is a plain click for menus, the restart button and
+# replayed setup clicks, as pyautogui.click() was. start_game() only needs click(), so a backend can stand
+# in for the pyautogui module there.
+class PyAutoGuiInput:
+    """The original input path: drops tween 0.1 s to the target, press, hold 0.1 s, release, plus pyautogui.PAUSE after each call."""
+    def __init__(self):
+        import pyautogui
+        self.pyautogui = pyautogui
+        self.pyautogui.FAILSAFE = True
+        self.counts = {"clicks": 0, "latency_ms": 0.0}
+
+    def drop(self, x, y):
+        t0 = time.perf_counter()
+        self.pyautogui.moveTo(x, y, duration=0.1)
+        self.pyautogui.mouseDown()
+        time.sleep(0.1)
+        self.pyautogui.mouseUp()
+        self.counts["clicks"] += 1
+        self.counts["latency_ms"] += (time.perf_counter() - t0) * 1000.0
+
+    def click(self, x, y):
+        self.pyautogui.click(x, y)
+
+    def take_counts(self):
+        """Drops sent and wall-clock time spent sending them since the last call."""
+        counts, self.counts = self.counts, {"clicks": 0, "latency_ms": 0.0}
+        return counts
+
+    def close(self):
+        pass
+
+class XTestInput:
+    """XTest fake input on one display connection, kept open: warp, press, (hold, for drops,) release, then one sync."""
+    def __init__(self, display=None, hold=CLICK_HOLD_SECONDS):
+        from Xlib import X, display as xdisplay, error
+        from Xlib.ext import xtest
+        self.X, self.xtest = X, xtest
+        self.hold = hold
+        try:
+            self.dpy = xdisplay.Display(display)
+        except error.DisplayError as e:
+            raise RuntimeError(f"Cannot open X display {display or os.environ.get('DISPLAY')}: {e}") from e
+        if not self.dpy.has_extension("XTEST"):
+            self.dpy.close()
+            raise RuntimeError("X server has no XTEST extension")
+        self.counts = {"clicks": 0, "latency_ms": 0.0}
+
+    def _press(self, x, y, hold):
+        self.xtest.fake_input(self.dpy, self.X.MotionNotify, x=int(x), y=int(y))
+        self.xtest.fake_input(self.dpy, self.X.ButtonPress, 1)
+        if hold > 0:
+            self.dpy.sync()
+            time.sleep(hold)
+        self.xtest.fake_input(self.dpy, self.X.ButtonRelease, 1)
+        self.dpy.sync()  # Returns once the server has processed all three events
+
+    def drop(self, x, y):
+        t0 = time.perf_counter()
+        self._press(x, y, self.hold)
+        self.counts["clicks"] += 1
+        self.counts["latency_ms"] += (time.perf_counter() - t0) * 1000.0
+
+    def click(self, x, y):
+        self._press(x, y, 0)
+
+    def take_counts(self):
+        """Drops sent and time until the X server had them since the last call."""
+        counts, self.counts = self.counts, {"clicks": 0, "latency_ms": 0.0}
+        return counts
+
+    def close(self):
+        if self.dpy is None: return
+        self.dpy.close()
+        self.dpy = None
+
+INPUT_BACKENDS = {
+    "pyautogui": PyAutoGuiInput,
+    "xtest": XTestInput,
+}
+
+def make_input(name=None):
+    """
+    Input backend from INPUT_BACKENDS (default: FITCATS_INPUT or "pyautogui"). If xtest cannot start
+    (python-xlib missing, no XTEST extension, no display), this falls back to pyautogui with a warning.
+    """
+    name = name or INPUT_BACKEND
+    try:
+        return INPUT_BACKENDS[name]()
+    except (ImportError, RuntimeError) as e:
+        if name == "pyautogui": raise
+        print(f"Warning: {name} input unavailable ({e}); falling back to pyautogui.")
+        return PyAutoGuiInput()
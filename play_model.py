@@ -72,11 +72,11 @@ def get_policy_distribution(model, obs_dict, lstm_states, episode_starts):
         dist, _ = model.policy.get_distribution(obs_dict, lstm_states_tensor, episode_starts_tensor)
         
         dists = dist.distribution
+        if not isinstance(dists, list): dists = [dists]  # Macro-action models have only the x head, and always drop
         x_dist = dists[0]
-        click_dist = dists[1]
         
         x_probs = x_dist.probs.cpu().numpy()[0]
-        click_probs = click_dist.probs.cpu().numpy()[0]
+        click_probs = dists[1].probs.cpu().numpy()[0] if len(dists) > 1 else np.array([0.0, 1.0])
         
         return x_probs, click_probs
 
@@ -183,6 +183,7 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--sandbox", type=str, default=":99", help="The sandbox display ID")
     parser.add_argument("--model-name", type=str, required=True, help="Name of the model to load")
+    parser.add_argument("--macro-actions", action="store_true", help="The model was trained with --macro-actions")
     args = parser.parse_args()
     
     print(f"=== Play Model: {args.model_name} ===")
@@ -209,6 +210,7 @@ def main():
     
     # Initialize Environment (connected to sandbox)
     os.environ["FITCATS_MODEL_NAME"] = args.model_name
+    if args.macro_actions: os.environ["FITCATS_MACRO_ACTIONS"] = "1"
     os.environ["DISPLAY"] = args.sandbox
     env = FitCatsEnv()
     if main_display: os.environ["DISPLAY"] = main_display
@@ -7,7 +7,7 @@ sudo apt-get update
 
 # Install X11 utilities and Window Manager
 echo "Installing Xephyr, Fluxbox, and Screen tools..."
-sudo apt-get install -y xserver-xephyr fluxbox scrot python3-tk python3-dev
+sudo apt-get install -y xserver-xephyr fluxbox scrot python3-tk python3-dev libxext6 libxdamage1 libxfixes3
 
 # Install Chromium (if not using Snap)
 # Note: On Ubuntu, Chromium is usually a Snap, which is pre-installed or installed via snap.
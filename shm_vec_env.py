@@ -0,0 +1,283 @@
+import multiprocessing as mp
+import pickle
+import warnings
+from multiprocessing import shared_memory
+import numpy as np
+from gymnasium import spaces
+from stable_baselines3.common.vec_env.base_vec_env import CloudpickleWrapper, VecEnv
+from stable_baselines3.common.vec_env.patch_gym import _patch_env
+
+# Shared-memory VecEnv. SubprocVecEnv pickles every observation through a pipe (a 160x160x3 board plus the
+# vectors, per agent, per step) and VecFrameStack then rolls a copy of the whole n_stack history in the main
+# process. Here each worker writes its observation, reward and done straight into one preallocated
+# shared-memory block, and the pipe only carries the action out and the info dict back.
+#
+# The frame stack lives in the same block as a mirrored ring per observation key: 2 * n_stack frame slots
+# along the last axis, frame t written to slot t % n_stack and again n_stack slots later. The stacked
+# observation for t is then always one contiguous window of slots, t % n_stack + 1 up to t % n_stack + n_stack,
+# oldest first and newest last, exactly what VecFrameStack(n_stack) hands the policy, so nothing is rolled.
+
+SHM_ALIGN = 64  # Byte alignment of each array in the block
+
+def _stacked_box(space, n_stack):
+    low = np.repeat(space.low, n_stack, axis=-1)
+    high = np.repeat(space.high, n_stack, axis=-1)
+    return spaces.Box(low=low, high=high, dtype=space.dtype)
+
+def _layout(observation_space, num_envs, n_stack):
+    """(name, shape, dtype, offset) of every array in the block, and its total size in bytes."""
+    subspaces = observation_space.spaces if isinstance(observation_space, spaces.Dict) else {None: observation_space}
+    arrays = []
+    for key, space in subspaces.items():
+        if not isinstance(space, spaces.Box):
+            raise ValueError(f"ShmVecEnv only stacks Box observations, got {space} for {key!r}")
+        shape = (num_envs, *space.shape[:-1], 2 * n_stack * space.shape[-1])
+        arrays.append((("obs", key), shape, space.dtype))
+    # Rewards as float64, like SubprocVecEnv returns them
+    arrays += [(("reward", None), (num_envs,), np.dtype(np.float64)), (("done", None), (num_envs,), np.dtype(bool))]
+    layout, size = [], 0
+    for name, shape, dtype in arrays:
+        size = -(-size // SHM_ALIGN) * SHM_ALIGN
+        layout.append((name, shape, np.dtype(dtype).str, size))
+        size += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return layout, max(size, 1)
+
+def _attach(shm, layout):
+    return {name: np.ndarray(shape, dtype, buffer=shm.buf, offset=offset) for name, shape, dtype, offset in layout}
+
+class _Ring:
+    """One env's view of the frame-stack rings: writes frames into both mirror slots and reads windows."""
+    def __init__(self, arrays, index, n_stack):
+        self.rings = {key: ring[index] for (kind, key), ring in arrays.items() if kind == "obs"}
+        self.n_stack = n_stack
+
+    def _slots(self, ring, slot):
+        c = ring.shape[-1] // (2 * self.n_stack)
+        return ring[..., slot * c:(slot + 1) * c]
+
+    def write(self, obs, t):
+        q = t % self.n_stack
+        for key, ring in self.rings.items():
+            frame = obs if key is None else obs[key]
+            self._slots(ring, q)[...] = frame
+            self._slots(ring, q + self.n_stack)[...] = frame
+
+    def clear(self):
+        for ring in self.rings.values():
+            ring[...] = 0
+
+    def window(self, t):
+        """Copy of the stacked observation for step t, in the observation's own structure."""
+        q = t % self.n_stack
+        c = {key: ring.shape[-1] // (2 * self.n_stack) for key, ring in self.rings.items()}
+        stacked = {key: ring[..., (q + 1) * c[key]:(q + 1 + self.n_stack) * c[key]].copy() for key, ring in self.rings.items()}
+        return stacked[None] if None in stacked else stacked
+
+def _worker(remote, parent_remote, env_fn_wrapper):
+    from stable_baselines3.common.env_util import is_wrapped
+    parent_remote.close()
+    env = _patch_env(env_fn_wrapper.var())
+    shm, arrays, ring, index = None, None, None, None
+    try:
+        while True:
+            try:
+                cmd, data = remote.recv()
+            except (EOFError, KeyboardInterrupt):
+                break
+            if cmd == "step":
+                action, t = data
+                observation, reward, terminated, truncated, info = env.step(action)
+                done = terminated or truncated
+                info["TimeLimit.truncated"] = truncated and not terminated
+                reset_info = {}
+                ring.write(observation, t)
+                if done:
+                    # The terminal observation is stacked on the env's history, as VecFrameStack does, then
+                    # the history is cleared and the reset observation starts a new one in the same slot.
+                    info["terminal_observation"] = ring.window(t)
+                    observation, reset_info = env.reset()
+                    ring.clear()
+                    ring.write(observation, t)
+                arrays["reward", None][index] = reward
+                arrays["done", None][index] = done
+                remote.send_bytes(pickle.dumps((info, reset_info), pickle.HIGHEST_PROTOCOL))
+            elif cmd == "reset":
+                seed, options, t = data
+                observation, reset_info = env.reset(seed=seed, **({"options": options} if options else {}))
+                ring.clear()
+                ring.write(observation, t)
+                remote.send(reset_info)
+            elif cmd == "attach":
+                name, layout, index, n_stack = data
+                shm = shared_memory.SharedMemory(name=name)
+                arrays = _attach(shm, layout)
+                ring = _Ring(arrays, index, n_stack)
+                remote.send(None)
+            elif cmd == "get_spaces":
+                remote.send((env.observation_space, env.action_space))
+            elif cmd == "render":
+                remote.send(env.render())
+            elif cmd == "env_method":
+                remote.send(env.get_wrapper_attr(data[0])(*data[1], **data[2]))
+            elif cmd == "get_attr":
+                remote.send(env.get_wrapper_attr(data))
+            elif cmd == "has_attr":
+                try:
+                    env.get_wrapper_attr(data)
+                    remote.send(True)
+                except AttributeError:
+                    remote.send(False)
+            elif cmd == "set_attr":
+                remote.send(setattr(env, data[0], data[1]))
+            elif cmd == "is_wrapped":
+                remote.send(is_wrapped(env, data))
+            elif cmd == "close":
+                env.close()
+                remote.close()
+                break
+            else:
+                raise NotImplementedError(f"`{cmd}` is not implemented in the worker")
+    finally:
+        arrays = ring = None  # Views must go before the block can be closed
+        if shm is not None: shm.close()
+
+class ShmVecEnv(VecEnv):
+    """
+    Drop-in for VecFrameStack(SubprocVecEnv(env_fns), n_stack) with observations, rewards and dones passed
+    through shared memory. `ipc_bytes` counts what step() has sent and received over the pipes.
+    """
+    def __init__(self, env_fns, n_stack=4, start_method=None):
+        self.waiting = False
+        self.closed = False
+        self.n_stack = n_stack
+        self.t = 0
+        self.ipc_bytes = 0
+        n_envs = len(env_fns)
+        if start_method is None:
+            start_method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        ctx = mp.get_context(start_method)
+
+        self.remotes, self.work_remotes = zip(*[ctx.Pipe() for _ in range(n_envs)])
+        self.processes = []
+        for work_remote, remote, env_fn in zip(self.work_remotes, self.remotes, env_fns):
+            process = ctx.Process(target=_worker, args=(work_remote, remote, CloudpickleWrapper(env_fn)), daemon=True)
+            process.start()
+            self.processes.append(process)
+            work_remote.close()
+
+        self.remotes[0].send(("get_spaces", None))
+        observation_space, action_space = self.remotes[0].recv()
+        layout, size = _layout(observation_space, n_envs, n_stack)
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.arrays = _attach(self.shm, layout)
+        for i, remote in enumerate(self.remotes):
+            remote.send(("attach", (self.shm.name, layout, i, n_stack)))
+        for remote in self.remotes:
+            remote.recv()
+
+        if isinstance(observation_space, spaces.Dict):
+            stacked_space = spaces.Dict({key: _stacked_box(space, n_stack) for key, space in observation_space.spaces.items()})
+        else:
+            stacked_space = _stacked_box(observation_space, n_stack)
+        # Two output buffers, used in turn: the observation step() returned last is still read (it becomes
+        # the rollout buffer's _last_obs) after the next step has overwritten the rings.
+        self.out_buffers = [{key: np.zeros((n_envs, *space.shape), space.dtype) for key, space in
+                             (stacked_space.spaces.items() if isinstance(stacked_space, spaces.Dict) else [(None, stacked_space)])}
+                            for _ in range(2)]
+        self.out_idx = 0
+        super().__init__(n_envs, stacked_space, action_space)
+
+    def _stacked_obs(self):
+        """Copies every env's window for the current step into the next output buffer."""
+        out = self.out_buffers[self.out_idx]
+        self.out_idx ^= 1
+        q = self.t % self.n_stack
+        for (kind, key), ring in self.arrays.items():
+            if kind != "obs": continue
+            c = ring.shape[-1] // (2 * self.n_stack)
+            np.copyto(out[key], ring[..., (q + 1) * c:(q + 1 + self.n_stack) * c])
+        return out[None] if None in out else out
+
+    # --- VecEnv ---
+    def step_async(self, actions):
+        self.t += 1
+        for remote, action in zip(self.remotes, actions):
+            msg = pickle.dumps(("step", (action, self.t)), pickle.HIGHEST_PROTOCOL)
+            self.ipc_bytes += len(msg)
+            remote.send_bytes(msg)
+        self.waiting = True
+
+    def step_wait(self):
+        infos, reset_infos = [], []
+        for remote in self.remotes:
+            msg = remote.recv_bytes()
+            self.ipc_bytes += len(msg)
+            info, reset_info = pickle.loads(msg)
+            infos.append(info)
+            reset_infos.append(reset_info)
+        self.waiting = False
+        self.reset_infos = reset_infos
+        return self._stacked_obs(), self.arrays["reward", None].copy(), self.arrays["done", None].copy(), infos
+
+    def reset(self):
+        for i, remote in enumerate(self.remotes):
+            remote.send(("reset", (self._seeds[i], self._options[i], self.t)))
+        self.reset_infos = [remote.recv() for remote in self.remotes]
+        self._reset_seeds()
+        self._reset_options()
+        return self._stacked_obs()
+
+    def close(self):
+        if self.closed: return
+        if self.waiting:
+            for remote in self.remotes:
+                remote.recv_bytes()
+        for remote in self.remotes:
+            remote.send(("close", None))
+        for process in self.processes:
+            process.join()
+        self.arrays = self.out_buffers = None
+        self.shm.close()
+        self.shm.unlink()
+        self.closed = True
+
+    def get_images(self):
+        if self.render_mode != "rgb_array":
+            warnings.warn(f"The render mode is {self.render_mode}, but this method assumes it is `rgb_array` to obtain images.")
+            return [None for _ in self.remotes]
+        for remote in self.remotes:
+            remote.send(("render", None))
+        return [remote.recv() for remote in self.remotes]
+
+    def has_attr(self, attr_name):
+        for remote in self.remotes:
+            remote.send(("has_attr", attr_name))
+        return all([remote.recv() for remote in self.remotes])
+
+    def get_attr(self, attr_name, indices=None):
+        remotes = self._get_target_remotes(indices)
+        for remote in remotes:
+            remote.send(("get_attr", attr_name))
+        return [remote.recv() for remote in remotes]
+
+    def set_attr(self, attr_name, value, indices=None):
+        remotes = self._get_target_remotes(indices)
+        for remote in remotes:
+            remote.send(("set_attr", (attr_name, value)))
+        for remote in remotes:
+            remote.recv()
+
+    def env_method(self, method_name, *method_args, indices=None, **method_kwargs):
+        remotes = self._get_target_remotes(indices)
+        for remote in remotes:
+            remote.send(("env_method", (method_name, method_args, method_kwargs)))
+        return [remote.recv() for remote in remotes]
+
+    def env_is_wrapped(self, wrapper_class, indices=None):
+        remotes = self._get_target_remotes(indices)
+        for remote in remotes:
+            remote.send(("is_wrapped", wrapper_class))
+        return [remote.recv() for remote in remotes]
+
+    def _get_target_remotes(self, indices):
+        return [self.remotes[i] for i in self._get_indices(indices)]
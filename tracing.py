@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager, nullcontext
+
+# Lightweight span tracer that writes Chrome-trace JSON (open it in https://ui.perfetto.dev or chrome://tracing).
+# Off unless FITCATS_TRACE_DIR is set. Each process then writes trace_rank<FITCATS_RANK>_<pid>.json there,
+# streaming events in the trace "JSON Array Format", so a worker that dies mid-run still leaves a readable file.
+
+TRACE_DIR = os.environ.get("FITCATS_TRACE_DIR")
+FLUSH_EVENTS = 1000  # Events buffered in memory before they are appended to the file
+
+class Tracer:
+    def __init__(self, path, process_name=None, flush_events=FLUSH_EVENTS):
+        self.path = path
+        self.pid = os.getpid()
+        self.flush_events = flush_events
+        self.events = []
+        self.lock = threading.Lock()
+        self.started = self.closed = False
+        # Wall-clock timestamps, so traces from different ranks line up when loaded together
+        self.wall0_us = time.time_ns() / 1000.0
+        self.perf0_ns = time.perf_counter_ns()
+        if process_name:
+            self.events.append({"ph": "M", "name": "process_name", "pid": self.pid, "tid": 0, "args": {"name": process_name}})
+        atexit.register(self.close)
+
+    def now_us(self):
+        return self.wall0_us + (time.perf_counter_ns() - self.perf0_ns) / 1000.0
+
+    @contextmanager
+    def span(self, name, **args):
+        start = self.now_us()
+        try:
+            yield
+        finally:
+            event = {"ph": "X", "name": name, "ts": start, "dur": self.now_us() - start,
+                     "pid": self.pid, "tid": threading.get_native_id()}
+            if args: event["args"] = args
+            with self.lock:
+                if not self.closed:
+                    self.events.append(event)
+                    if len(self.events) >= self.flush_events: self._flush()
+
+    def _flush(self):
+        if not self.events: return
+        with open(self.path, "a") as f:
+            for event in self.events:
+                f.write((",\n" if self.started else "[\n") + json.dumps(event))
+                self.started = True
+        self.events = []
+
+    def flush(self):
+        with self.lock: self._flush()
+
+    def close(self):
+        with self.lock:
+            if self.closed: return
+            self._flush()
+            if self.started:
+                with open(self.path, "a") as f: f.write("\n]\n")
+            self.closed = True
+
+_tracer = None
+_NULL_SPAN = nullcontext()
+
+def get_tracer():
+    """The tracer of the current process (created on first use, so forked workers get their own), or None when tracing is off."""
+    global _tracer
+    if TRACE_DIR is None: return None
+    if _tracer is None or _tracer.pid != os.getpid():
+        rank = os.environ.get("FITCATS_RANK", "0")
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        path = os.path.join(TRACE_DIR, f"trace_rank{rank}_{os.getpid()}.json")
+        _tracer = Tracer(path, process_name=f"rank {rank} ({os.environ.get('DISPLAY', ':0')})")
+    return _tracer
+
+def span(name, **args):
+    """Context manager recording a named span (nested spans nest in the viewer); a shared no-op when tracing is off."""
+    tracer = get_tracer()
+    return tracer.span(name, **args) if tracer is not None else _NULL_SPAN
@@ -4,6 +4,7 @@ import time
 from sb3_contrib import RecurrentPPO
 from stable_baselines3.common.vec_env import SubprocVecEnv, VecFrameStack, VecTransposeImage
 from stable_baselines3.common.monitor import Monitor
+from shm_vec_env import ShmVecEnv
 from stable_baselines3.common.callbacks import CheckpointCallback, BaseCallback
 from stable_baselines3.common.logger import Image, TensorBoardOutputFormat
 import argparse
@@ -94,9 +95,13 @@ class MissionControlCallback(BaseCallback):
         # --- KEY FIX: Initialize missing variables ---
         total_cats_on_board = 0
         max_cat_type_seen = 0
+        perception_totals = {}
         
         for i in range(self.num_agents):
             info = self.locals["infos"][i]
+            for key, value in info.items():
+                if key.startswith(("perception/", "input/", "control/", "macro/", "step/")):
+                    perception_totals[key] = perception_totals.get(key, 0.0) + value
             self.agent_current_scores[i] = info.get("game/score", self.agent_current_scores[i])
             self.agent_steps[i] = info.get("game/step_count", self.agent_steps[i])
             self.agent_cat_counts[i] = info.get("game/cat_count", self.agent_cat_counts[i])
@@ -177,6 +182,8 @@ class MissionControlCallback(BaseCallback):
             avg_cats = 0.0
             
         self.logger.record("game/avg_cats_on_board", avg_cats)
+        for key, total in perception_totals.items():
+            self.logger.record(key, total / self.num_agents)
         self.logger.record("game/max_cat_type_seen", max_cat_type_seen)
 
         current_pile_heights = self.locals["new_obs"]["pile_height"][:, -1]
@@ -291,6 +298,7 @@ def make_env(display_id, rank, log_dir):
     """Utility function for multiprocessed env."""
     def _init():
         os.environ["DISPLAY"] = display_id
+        os.environ["FITCATS_RANK"] = str(rank)  # Names this worker's trace file when FITCATS_TRACE_DIR is set
         from fit_cats_env import FitCatsEnv
         log_file = os.path.join(log_dir, f"monitor_{rank}.csv")
         env = Monitor(FitCatsEnv(), log_file)
@@ -302,6 +310,8 @@ def main():
     parser.add_argument("--num-agents", type=int, default=2, help="Number of parallel agents to run")
     default_name = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     parser.add_argument("--model-name", type=str, default=default_name, help="Name of the model (for saving/loading)")
+    parser.add_argument("--macro-actions", action="store_true", help="One transition per drop: the agent picks only x, and each step lasts until the board settles")
+    parser.add_argument("--vec-env", choices=["subproc", "shm"], default="subproc", help="Observation transport: SubprocVecEnv pipes + VecFrameStack, or shared memory (ShmVecEnv)")
     args = parser.parse_args()
 
     num_agents = args.num_agents
@@ -310,6 +320,7 @@ def main():
     total_timesteps = 200000
     
     os.environ["FITCATS_MODEL_NAME"] = model_name
+    if args.macro_actions: os.environ["FITCATS_MACRO_ACTIONS"] = "1"
     
     print(f"--- Launching {num_agents} agents for model '{model_name}' ---")
 
@@ -339,9 +350,10 @@ def main():
     os.makedirs(log_dir, exist_ok=True)
 
     env_fns = [make_env(f":9{i+1}", i, log_dir) for i in range(num_agents)]
-    env = SubprocVecEnv(env_fns)
-    
-    env = VecFrameStack(env, n_stack=4)
+    if args.vec_env == "shm":
+        env = ShmVecEnv(env_fns, n_stack=4)  # Same stacked observations as below, without pickling them per step
+    else:
+        env = VecFrameStack(SubprocVecEnv(env_fns), n_stack=4)
 
     checkpoint_callback = CheckpointCallback(save_freq=1000, save_path=log_dir, name_prefix="model")
     mission_control_callback = MissionControlCallback(num_agents=num_agents, total_timesteps=total_timesteps, n_steps=n_steps, model_name=model_name, log_freq=256)